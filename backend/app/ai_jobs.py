@@ -0,0 +1,446 @@
+"""
+AI image generation as background jobs.
+
+POST /generate-ai-image only records a job row and returns its id; the
+client polls GET /ai-jobs/{id}. A small pool of worker tasks claims queued
+jobs from the database with a single conditional UPDATE, so job state
+survives restarts and several app processes can share one queue. A worker
+never claims a job for a user who already has AI_JOB_USER_CONCURRENCY jobs
+running, and a running job whose process died is re-run once it is older
+than AI_JOB_TIMEOUT.
+
+Requests with a seed are deterministic, so their results are cached by
+normalized (prompt, negative_prompt, model, seed): a repeat reuses the
+stored asset, and identical requests already in flight share one upstream
+call. The cache and the in-flight table are per process.
+"""
+import asyncio
+import hashlib
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Form
+from sqlalchemy import select, update, func, or_, and_
+from sqlalchemy.orm import Session
+from . import models, schemas, image_processing
+from .ai_providers import ai_provider
+from .auth import get_current_user
+from .cache import TTLCache
+from .config import settings
+from .database import SessionLocal, get_db
+from .images import add_image_counts, stored_duplicate_asset, upload_to_storage
+from .versions import new_image_scopes, bump_versions
+from .workers import image_executor, io_executor
+
+router = APIRouter()
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# Prompt key -> content_hash of the generated original
+prompt_cache = TTLCache(max_size=settings.AI_CACHE_SIZE, ttl=settings.AI_CACHE_TTL)
+# Prompt key -> future resolving to the asset of the generation in progress
+_inflight = {}
+_coalesced = 0
+
+
+def prompt_key(prompt, negative_prompt, model, seed):
+    """Cache key for a generation request; whitespace differences don't matter"""
+    normalized = [" ".join((text or "").split()) for text in (prompt, negative_prompt)]
+    return hashlib.sha256("\0".join(normalized + [model, str(seed)]).encode()).hexdigest()
+
+
+async def generate_ai_asset(prompt, negative_prompt=None, seed=None):
+    """
+    Return the asset columns for a generated image, reusing a cached or
+    in-flight result for the same seeded request when there is one.
+    """
+    global _coalesced
+    if seed is None or settings.AI_CACHE_SIZE <= 0:
+        return await _generate_ai_asset(prompt, negative_prompt, seed)
+
+    key = prompt_key(prompt, negative_prompt, ai_provider.model, seed)
+    content_hash = prompt_cache.get(key)
+    if content_hash:
+        # The image may have been deleted since; only reuse files still in use
+        existing = await io_executor.run(stored_duplicate_asset, content_hash)
+        if existing:
+            print("♻️ Prompt cache hit")
+            return existing
+        prompt_cache.discard(key)
+
+    if key in _inflight:
+        _coalesced += 1
+        print("♻️ Identical generation in progress, waiting for it")
+        return await asyncio.shield(_inflight[key])
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        asset = await _generate_ai_asset(prompt, negative_prompt, seed)
+    except BaseException as e:
+        # A leader cut off by its job timeout (or shutdown) is cancelled; its
+        # followers see a timeout instead, so they fail rather than look cancelled
+        future.set_exception(asyncio.TimeoutError() if isinstance(e, asyncio.CancelledError) else e)
+        future.exception()  # Mark retrieved in case nobody was waiting
+        raise
+    else:
+        prompt_cache.set(key, asset["content_hash"])
+        future.set_result(asset)
+        return asset
+    finally:
+        del _inflight[key]
+
+
+def prompt_cache_stats():
+    return {**prompt_cache.stats(), "in_flight": len(_inflight), "coalesced": _coalesced}
+
+
+async def _generate_ai_asset(prompt, negative_prompt, seed):
+    """Generate an image for prompt, push it and its derivatives to storage, and return the asset columns"""
+    file_ext = ".png"
+
+    image = await io_executor.run(ai_provider.generate, prompt, negative_prompt, seed)
+
+    # Encode to PNG in the image worker pool
+    image_data = await image_executor.run(image_processing.encode_png, image)
+
+    # Verify we got an actual image
+    if not image_data or len(image_data) == 0:
+        raise HTTPException(status_code=500, detail="AI service returned empty image")
+
+    # Identical bytes were stored before: reuse that original and its derivatives
+    content_hash = hashlib.sha256(image_data).hexdigest()
+    existing = await io_executor.run(stored_duplicate_asset, content_hash)
+    if existing:
+        return existing
+
+    # Create the thumbnail and derivatives in the image worker pool
+    width, height, thumbnail_data, derivatives, phash = await image_executor.run(
+        image_processing.process_generated, image
+    )
+    print(f"📐 Image dimensions: {width}x{height}")
+
+    # Generate unique filenames
+    original_public_id = f"ai-images/{uuid.uuid4()}{file_ext}"
+    thumbnail_public_id = f"ai-thumbnails/{uuid.uuid4()}"
+
+    if not thumbnail_data:
+        raise HTTPException(status_code=500, detail="Failed to generate thumbnail")
+
+    # Upload original, thumbnail and derivatives to Cloudinary concurrently
+    print(f"☁️ Uploading original, thumbnail and {len(derivatives)} derivatives to Cloudinary...")
+    original_result, thumbnail_result, derivative_records = await upload_to_storage(
+        image_data, original_public_id, thumbnail_data, thumbnail_public_id, derivatives
+    )
+
+    if not original_result:
+        raise HTTPException(status_code=500, detail="Failed to upload image to cloud storage")
+    if not thumbnail_result:
+        raise HTTPException(status_code=500, detail="Failed to upload thumbnail to cloud storage")
+
+    return {
+        "filename": original_public_id,
+        "file_path": original_result['secure_url'],
+        "thumbnail_path": thumbnail_result['secure_url'],
+        "thumbnail_public_id": thumbnail_public_id,
+        "file_size": len(image_data),
+        "width": width,
+        "height": height,
+        "derivatives": derivative_records,
+        "content_hash": content_hash,
+        "perceptual_hash": phash,
+    }
+
+
+def describe_error(error):
+    """The message stored on a failed job"""
+    if isinstance(error, HTTPException):
+        return error.detail
+    if isinstance(error, (asyncio.TimeoutError, asyncio.CancelledError)):
+        return "AI generation timed out. Please try again."
+
+    message = str(error).lower()
+    if "authentication" in message or "token" in message:
+        return "AI service authentication failed. Please check your API token."
+    elif "timeout" in message:
+        return "AI generation timed out. Please try again."
+    elif "model" in message or "flux" in message:
+        return "AI model not available. Please try again later."
+    else:
+        return f"AI generation failed: {str(error)}"
+
+
+def claim_next_job(db: Session):
+    """
+    Atomically mark the oldest runnable job as running and return its id, or None.
+
+    The status check is repeated in the UPDATE itself, so when two workers
+    race for the same row only one of them gets it back.
+    """
+    now = datetime.now(timezone.utc)
+    stale = now - timedelta(seconds=settings.AI_JOB_TIMEOUT)
+    Job = models.AIJob
+
+    busy_users = select(Job.user_id).where(
+        Job.status == "running",
+        Job.started_at >= stale
+    ).group_by(Job.user_id).having(func.count() >= settings.AI_JOB_USER_CONCURRENCY)
+
+    claimable = or_(
+        Job.status == "queued",
+        and_(Job.status == "running", Job.started_at < stale)
+    )
+    next_job = select(Job.id).where(
+        claimable,
+        Job.user_id.not_in(busy_users)
+    ).order_by(Job.id).limit(1).scalar_subquery()
+
+    job_id = db.execute(
+        update(Job)
+        .where(Job.id == next_job, claimable)
+        .values(status="running", started_at=now, error=None)
+        .returning(Job.id)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    db.commit()
+    return job_id
+
+
+class AIJobRunner:
+    """Worker tasks on the event loop that claim and run queued AI jobs"""
+
+    def __init__(self, workers, timeout, poll_interval):
+        self.workers = workers
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._tasks = []
+        self._wake = None
+        self._running = 0
+        self._succeeded = 0
+        self._failed = 0
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        print(f"🤖 Started {self.workers} AI job workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self):
+        """Let idle workers look for a new job now instead of at their next poll"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _work(self):
+        while True:
+            self._wake.clear()
+            try:
+                job_id = await io_executor.run(self._claim)
+            except Exception as e:
+                print(f"❌ Error claiming AI job: {e}")
+                job_id = None
+
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._running += 1
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                # The job stays running and is picked up again once it goes stale
+                print(f"❌ Error running AI job {job_id}: {e}")
+            finally:
+                self._running -= 1
+
+    # Database work runs in the io executor with a session of its own, so the
+    # event loop never waits on a pool checkout or SQLite's write lock
+
+    def _claim(self):
+        db = SessionLocal()
+        try:
+            return claim_next_job(db)
+        finally:
+            db.close()
+
+    def _load(self, job_id):
+        db = SessionLocal()
+        try:
+            return db.get(models.AIJob, job_id)
+        finally:
+            db.close()
+
+    def _requeue(self, job_id):
+        db = SessionLocal()
+        try:
+            db.query(models.AIJob).filter(models.AIJob.id == job_id).update(
+                {"status": "queued", "started_at": None}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _finish(self, job_id, asset, error):
+        """Save the generated image on the job, or mark it failed"""
+        db = SessionLocal()
+        try:
+            job = db.get(models.AIJob, job_id)
+            if error is None:
+                try:
+                    db_image = models.Image(
+                        **asset,
+                        original_filename=f"ai-generated-{uuid.uuid4()}.png",
+                        mime_type="image/png",
+                        title=job.title or f"AI Generated: {job.prompt[:50]}...",
+                        caption=job.caption or f"Generated from prompt: {job.prompt}",
+                        alt_text=f"AI generated image based on prompt: {job.prompt}",
+                        privacy=job.privacy,
+                        uploaded_by=job.user_id
+                    )
+                    db.add(db_image)
+                    bump_versions(db, new_image_scopes(job.user_id, job.privacy))
+                    db.flush()
+                    job.image_id = db_image.id
+                    job.status = "succeeded"
+                    print(f"✅ AI job {job_id} saved as image {db_image.id}")
+                except Exception as e:
+                    db.rollback()
+                    job = db.get(models.AIJob, job_id)
+                    error = e
+            if error is not None:
+                print(f"❌ AI job {job_id} failed: {error!r}")
+                job.status = "failed"
+                job.error = describe_error(error)
+            job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+            return error is None
+        finally:
+            db.close()
+
+    async def _run(self, job_id):
+        job = await io_executor.run(self._load, job_id)
+        print(f"🎨 Running AI job {job.id} for user {job.user_id}")
+        print(f"📝 Prompt: {job.prompt}")
+        asset = error = None
+        try:
+            asset = await asyncio.wait_for(
+                generate_ai_asset(job.prompt, job.negative_prompt, job.seed), self.timeout
+            )
+        except asyncio.CancelledError as e:
+            if asyncio.current_task().cancelling():
+                # Shutting down: hand the job back so it runs again after restart
+                await io_executor.run(self._requeue, job_id)
+                raise
+            # Something this job awaited was cancelled, not the worker itself
+            error = e
+        except Exception as e:
+            error = e
+
+        # Shielded, so a shutdown can't interrupt the job's row being written
+        if await asyncio.shield(io_executor.run(self._finish, job_id, asset, error)):
+            self._succeeded += 1
+        else:
+            self._failed += 1
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "succeeded": self._succeeded,
+            "failed": self._failed,
+        }
+
+
+ai_job_runner = AIJobRunner(
+    workers=settings.AI_JOB_WORKERS,
+    timeout=settings.AI_JOB_TIMEOUT,
+    poll_interval=settings.AI_JOB_POLL_INTERVAL,
+)
+
+
+def job_response(db: Session, job, current_user_id):
+    job_dict = {c.name: getattr(job, c.name) for c in job.__table__.columns}
+    if job.image_id:
+        image = db.get(models.Image, job.image_id)
+        if image:
+            job_dict["image"] = add_image_counts(image, current_user_id)
+    return job_dict
+
+
+@router.post("/generate-ai-image", response_model=schemas.AIJobResponse, status_code=202)
+def generate_ai_image(
+    prompt: str = Form(...),
+    negative_prompt: str = Form(None),
+    seed: Optional[int] = Form(None),
+    title: str = Form(None),
+    caption: str = Form(None),
+    privacy: str = Form("private"),
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """
+    Queue an AI image generation with the configured provider (Nebius FLUX.1-dev by default).
+    Poll /ai-jobs/{id} for the result. Pass a seed for a reproducible (and cacheable) image.
+    """
+    if not ai_provider.is_configured:
+        print("❌ HUGGING_FACE_TOKEN not configured")
+        raise HTTPException(status_code=500, detail="AI service not configured. Please contact administrator.")
+
+    active = db.query(models.AIJob.user_id).filter(models.AIJob.status.in_(ACTIVE_STATUSES))
+    if active.filter(models.AIJob.user_id == current_user.id).count() >= settings.AI_JOB_USER_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many AI generations in progress. Please wait for one to finish.",
+            headers={"Retry-After": "10"}
+        )
+    if active.count() >= settings.AI_JOB_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=503,
+            detail="AI generation queue is full. Please try again later.",
+            headers={"Retry-After": "30"}
+        )
+
+    job = models.AIJob(
+        user_id=current_user.id,
+        model=ai_provider.model,
+        prompt=prompt,
+        negative_prompt=negative_prompt,
+        seed=seed,
+        title=title,
+        caption=caption,
+        privacy=privacy
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    ai_job_runner.wake()
+
+    print(f"🎨 Queued AI job {job.id} for user {current_user.id}")
+    return {
+        "success": True,
+        "message": "AI image generation queued",
+        "job": job_response(db, job, current_user.id)
+    }
+
+
+@router.get("/ai-jobs/{job_id}", response_model=schemas.AIJob)
+def get_ai_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """Status of one of the current user's AI generation jobs, with the image once it succeeded"""
+    job = db.query(models.AIJob).filter(
+        models.AIJob.id == job_id,
+        models.AIJob.user_id == current_user.id
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(db, job, current_user.id)
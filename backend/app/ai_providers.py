@@ -0,0 +1,75 @@
+"""
+Text-to-image providers for AI generation jobs.
+
+ai_jobs.py only talks to the `ai_provider` singleton below, which exposes:
+
+    model           name of the model, recorded with each job
+    is_configured   False when the provider can't be used (e.g. no API token)
+    generate(prompt, negative_prompt=None, seed=None) -> PIL.Image  (blocking)
+
+AI_PROVIDER picks the implementation: "nebius" (default) or "fake", a local
+generator with no network calls for development and load tests.
+"""
+import hashlib
+import time
+from PIL import Image
+from .config import settings
+
+
+class NebiusProvider:
+    """FLUX.1-dev through the Hugging Face InferenceClient, Nebius provider"""
+
+    def __init__(self):
+        self.model = settings.AI_MODEL
+        self.is_configured = bool(settings.HUGGING_FACE_TOKEN)
+        self._client = None
+
+    def _get_client(self):
+        # One client for the whole process instead of one per generation
+        if self._client is None:
+            from huggingface_hub import InferenceClient
+            self._client = InferenceClient(
+                provider="nebius",
+                api_key=settings.HUGGING_FACE_TOKEN,
+            )
+        return self._client
+
+    def generate(self, prompt, negative_prompt=None, seed=None):
+        print(f"🌐 Calling Nebius Inference API with {self.model}...")
+        return self._get_client().text_to_image(
+            prompt,
+            model=self.model,
+            negative_prompt=negative_prompt,
+            seed=seed
+        )
+
+
+class FakeProvider:
+    """
+    Draws a gradient whose colours are derived from the prompt and seed,
+    after FAKE_AI_LATENCY seconds. The same request always gives the same image.
+    """
+
+    size = (1024, 1024)
+
+    def __init__(self):
+        self.model = "fake"
+        self.is_configured = True
+
+    def generate(self, prompt, negative_prompt=None, seed=None):
+        if settings.FAKE_AI_LATENCY > 0:
+            time.sleep(settings.FAKE_AI_LATENCY)
+        colours = hashlib.sha256(f"{prompt}\0{negative_prompt or ''}\0{seed}".encode()).digest()
+        start, end = Image.new("RGB", self.size, tuple(colours[:3])), Image.new("RGB", self.size, tuple(colours[3:6]))
+        mask = Image.linear_gradient("L").resize(self.size)
+        return Image.composite(start, end, mask)
+
+
+def create_provider():
+    if settings.AI_PROVIDER == "fake":
+        print("🧪 Using the fake AI image provider")
+        return FakeProvider()
+    return NebiusProvider()
+
+
+ai_provider = create_provider()
@@ -1,54 +1,86 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
 from . import models, schemas
+from .cache import TTLCache
+from .config import settings
 from .database import SessionLocal, get_db
+from .versions import GLOBAL, profile_scope, user_scope, bump_versions
+from .workers import password_executor
 
 # Security configuration
 SECRET_KEY = "your-secret-key-here"  # Change this in production!
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes at any other cost are rehashed at BCRYPT_ROUNDS on the next successful login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Verified tokens -> user snapshot, so authenticated requests skip the users query
+user_cache = TTLCache(max_size=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# bcrypt is deliberately slow, so it runs on its own bounded pool rather than
+# the request threadpool; a full pool answers 503 instead of queueing logins
+async def verify_password(plain_password, hashed_password):
+    """Return (is_valid, new_hash); new_hash is set when the stored hash needs upgrading"""
+    return await password_executor.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash(password):
+    return await password_executor.run(pwd_context.hash, password)
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = get_user_by_email(db, email)
+# The login and register handlers are async so bcrypt can go to its own pool; their
+# database calls go to the threadpool, so the event loop never waits on a pool checkout
+async def authenticate_user(db: Session, email: str, password: str):
+    user = await run_in_threadpool(get_user_by_email, db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    user_id, user_email = user.id, user.email
+    is_valid, new_hash = await verify_password(password, user.hashed_password)
+    if not is_valid:
         return False
+    if new_hash:
+        user.hashed_password = new_hash
+        await run_in_threadpool(db.commit)
+        print(f"🔐 Rehashed password for user {user_id}")
     
     # Create and return token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user_email}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+def _save_user(db: Session, db_user):
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+async def create_user(db: Session, user: schemas.UserCreate):
+    hashed_password = await get_password_hash(user.password)
     db_user = models.User(
         email=user.email, 
         hashed_password=hashed_password, 
         full_name=user.full_name
     )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    return await run_in_threadpool(_save_user, db, db_user)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -59,8 +91,31 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
-    
-async def get_current_user(
+
+def invalidate_cached_user(user_id: int):
+    """Forget every cached token for this user"""
+    user_cache.discard_where(lambda cached: cached.id == user_id)
+
+# Columns no response shows; the password rehash at login changes only these
+HIDDEN_USER_COLUMNS = {"hashed_password"}
+
+@event.listens_for(models.User, "after_delete")
+def _user_changed(mapper, connection, target):
+    invalidate_cached_user(target.id)
+    # Names show in the user's own views and next to their public images and comments
+    bump_versions(connection, [profile_scope(target.id), user_scope(target.id), GLOBAL])
+
+@event.listens_for(models.User, "after_update")
+def _user_updated(mapper, connection, target):
+    state = inspect(target)
+    changed = {attr.key for attr in mapper.column_attrs if state.attrs[attr.key].history.has_changes()}
+    # A rehash leaves every cached user and page as it was
+    if changed <= HIDDEN_USER_COLUMNS:
+        return
+    _user_changed(mapper, connection, target)
+
+
+def get_current_user(
     token: str = Depends(oauth2_scheme), 
     db: Session = Depends(get_db)  # Use get_db directly instead of database.get_db
 ):
@@ -69,6 +124,12 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # Keyed by a hash of the exact token, which was already verified when cached
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    cached = user_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -80,4 +141,8 @@ async def get_current_user(
     user = get_user_by_email(db, email=email)
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+
+    # A detached snapshot, never outliving the token itself
+    current_user = schemas.User.model_validate(user)
+    user_cache.set(cache_key, current_user, expires_in=payload["exp"] - time.time())
+    return current_user
@@ -1,9 +1,11 @@
+from concurrent.futures import ThreadPoolExecutor
 import cloudinary
 import cloudinary.uploader
 from cloudinary import api
+from cloudinary.utils import get_http_connector
+from urllib3.util import Retry, Timeout
 from .config import settings
-from PIL import Image
-import io
+from . import image_processing
 
 class CloudinaryClient:
     def __init__(self):
@@ -22,6 +24,11 @@ class CloudinaryClient:
                 api_secret=settings.CLOUDINARY_API_SECRET,
                 secure=True
             )
+            if settings.CLOUDINARY_UPLOAD_PREFIX:
+                cloudinary.config(upload_prefix=settings.CLOUDINARY_UPLOAD_PREFIX)
+            
+            # Uploads and deletes share one keep-alive connection pool
+            cloudinary.uploader._http = self._create_http_pool()
             
             # Test the configuration
             api.ping()
@@ -32,8 +39,36 @@ class CloudinaryClient:
             print(f"❌ Failed to configure Cloudinary: {e}")
             self.is_configured = False
 
+    @staticmethod
+    def _create_http_pool():
+        """
+        Build the connection pool used by cloudinary.uploader.
+
+        The SDK's default pool keeps a single connection per host, so
+        concurrent uploads keep reconnecting. This one holds STORAGE_POOL_SIZE
+        keep-alive connections with explicit timeouts and retries. Uploads use
+        a fixed public_id with overwrite, so retrying a POST is safe.
+        """
+        retries = Retry(
+            total=settings.STORAGE_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,
+            raise_on_status=False
+        )
+        timeout = Timeout(
+            connect=settings.STORAGE_CONNECT_TIMEOUT,
+            read=settings.STORAGE_READ_TIMEOUT
+        )
+        return get_http_connector(cloudinary.config(), dict(
+            cloudinary.CERT_KWARGS,
+            maxsize=settings.STORAGE_POOL_SIZE,
+            retries=retries,
+            timeout=timeout
+        ))
+
     def upload_image(self, file_data, public_id, folder=None):
-        """Upload image to Cloudinary"""
+        """Upload image bytes or an open file handle to Cloudinary"""
         if not self.is_configured:
             print("❌ Cloudinary not configured - skipping upload")
             return None
@@ -48,11 +83,18 @@ class CloudinaryClient:
             if folder:
                 upload_params["folder"] = folder
             
-            # Upload the image
-            result = cloudinary.uploader.upload(
-                file_data,
-                **upload_params
-            )
+            # Upload the image; file handles are streamed in chunks instead of read whole
+            if hasattr(file_data, "read"):
+                result = cloudinary.uploader.upload_large(
+                    file_data,
+                    chunk_size=settings.STORAGE_CHUNK_SIZE,
+                    **upload_params
+                )
+            else:
+                result = cloudinary.uploader.upload(
+                    file_data,
+                    **upload_params
+                )
             print(f"✅ Upload successful for {public_id}")
             return result
         except Exception as e:
@@ -61,23 +103,7 @@ class CloudinaryClient:
 
     def generate_thumbnail(self, image_data, size=(300, 300)):
         """Generate thumbnail from image data"""
-        try:
-            with Image.open(io.BytesIO(image_data)) as img:
-                img.thumbnail(size)
-                thumb_buffer = io.BytesIO()
-                
-                # Convert to appropriate format
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                    img.save(thumb_buffer, format="JPEG", quality=85)
-                else:
-                    img.save(thumb_buffer, format="WEBP", quality=85)
-                
-                thumb_buffer.seek(0)
-                return thumb_buffer.getvalue()
-        except Exception as e:
-            print(f"❌ Error generating thumbnail: {e}")
-            return None
+        return image_processing.generate_thumbnail(image_data, size)
 
     def get_image_url(self, public_id, transformation=None):
         """Get image URL with optional transformations"""
@@ -106,5 +132,28 @@ class CloudinaryClient:
             print(f"❌ Error deleting image from Cloudinary: {e}")
             return False
 
+    def _destroy(self, public_id):
+        try:
+            return cloudinary.uploader.destroy(public_id).get("result") in ("ok", "not found")
+        except Exception as e:
+            print(f"❌ Error deleting {public_id} from Cloudinary: {e}")
+            return False
+
+    def delete_images(self, public_ids):
+        """
+        Delete images through the Upload API, so they share the upload
+        connection pool (and stay clear of the Admin API's hourly rate limit),
+        up to STORAGE_POOL_SIZE at a time. Returns the ids that are gone
+        (deleted now or already missing); the rest are left for a retry.
+        """
+        if not self.is_configured:
+            raise RuntimeError("Cloudinary not configured")
+        if not public_ids:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(settings.STORAGE_POOL_SIZE, len(public_ids))) as pool:
+            destroyed = list(pool.map(self._destroy, public_ids))
+        return [public_id for public_id, ok in zip(public_ids, destroyed) if ok]
+
 # Create a singleton instance
 cloudinary_client = CloudinaryClient()
@@ -10,12 +10,123 @@ class Settings:
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # Database: PostgreSQL when DATABASE_URL is set, a local SQLite file otherwise
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./image_gallery.db").replace("postgres://", "postgresql://", 1)
+    # Connection pool; the default total (40) matches the request threadpool
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    # PostgreSQL only: test connections before use and replace them before a proxy's idle timeout
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    # SQLite only: pragmas applied to every new connection (busy timeout in ms, mmap size in bytes)
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT: int = int(os.getenv("SQLITE_BUSY_TIMEOUT", "15000"))
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
     
     # Cloudinary Configuration
     CLOUDINARY_CLOUD_NAME: str = os.getenv("CLOUDINARY_CLOUD_NAME", "")
     CLOUDINARY_API_KEY: str = os.getenv("CLOUDINARY_API_KEY", "")
     CLOUDINARY_API_SECRET: str = os.getenv("CLOUDINARY_API_SECRET", "")
+    # Point uploads at another host, e.g. a local fake storage server
+    CLOUDINARY_UPLOAD_PREFIX: str = os.getenv("CLOUDINARY_UPLOAD_PREFIX", "")
+
+    # Responsive derivatives generated per upload (for srcset); formats Pillow can't encode are skipped
+    DERIVATIVE_WIDTHS: list = [int(w) for w in os.getenv("DERIVATIVE_WIDTHS", "320,640,1280").split(",") if w.strip()]
+    DERIVATIVE_FORMATS: list = [f.strip().lower() for f in os.getenv("DERIVATIVE_FORMATS", "avif,webp,jpeg").split(",") if f.strip()]
+
+    # Upload ingestion: size limits and where uploads are spooled to disk
+    MAX_UPLOAD_SIZE: int = int(os.getenv("MAX_UPLOAD_SIZE", str(50 * 1024 * 1024)))
+    MAX_REQUEST_SIZE: int = int(os.getenv("MAX_REQUEST_SIZE", str(51 * 1024 * 1024)))
+    UPLOAD_SPOOL_DIR: str = os.getenv("UPLOAD_SPOOL_DIR", "")
+    # /api/upload/batch: files per request, total body size, and files processed at once
+    MAX_BATCH_FILES: int = int(os.getenv("MAX_BATCH_FILES", "100"))
+    MAX_BATCH_REQUEST_SIZE: int = int(os.getenv("MAX_BATCH_REQUEST_SIZE", str(1024 * 1024 * 1024)))
+    BATCH_UPLOAD_CONCURRENCY: int = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "4"))
+
+    # Where images are stored: "cloudinary" or "local" (content-addressed files served from /media)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "cloudinary").lower()
+    LOCAL_STORAGE_ROOT: str = os.getenv("LOCAL_STORAGE_ROOT", "./media")
+    LOCAL_STORAGE_BASE_URL: str = os.getenv("LOCAL_STORAGE_BASE_URL", "http://localhost:8000")
+    # Internal nginx location mapped to LOCAL_STORAGE_ROOT, to serve files via X-Accel-Redirect
+    LOCAL_STORAGE_ACCEL_REDIRECT: str = os.getenv("LOCAL_STORAGE_ACCEL_REDIRECT", "")
+
+    # Shared HTTP connection pool for storage uploads and deletes
+    STORAGE_POOL_SIZE: int = int(os.getenv("STORAGE_POOL_SIZE", "16"))
+    STORAGE_CONNECT_TIMEOUT: float = float(os.getenv("STORAGE_CONNECT_TIMEOUT", "5"))
+    STORAGE_READ_TIMEOUT: float = float(os.getenv("STORAGE_READ_TIMEOUT", "60"))
+    STORAGE_RETRIES: int = int(os.getenv("STORAGE_RETRIES", "2"))
+    # File handles are uploaded in chunks of this size (Cloudinary's minimum is 5 MB)
+    STORAGE_CHUNK_SIZE: int = int(os.getenv("STORAGE_CHUNK_SIZE", str(6 * 1024 * 1024)))
+
+    # Background deletion of stored files queued by image deletes (see outbox.py)
+    STORAGE_DELETE_BATCH_SIZE: int = int(os.getenv("STORAGE_DELETE_BATCH_SIZE", "100"))
+    STORAGE_DELETE_POLL_INTERVAL: float = float(os.getenv("STORAGE_DELETE_POLL_INTERVAL", "5"))
+    STORAGE_DELETE_RETRY_DELAY: float = float(os.getenv("STORAGE_DELETE_RETRY_DELAY", "30"))
+    STORAGE_DELETE_MAX_ATTEMPTS: int = int(os.getenv("STORAGE_DELETE_MAX_ATTEMPTS", "10"))
+
+    # Per-process cache of authenticated users; entries never outlive their token
+    USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    USER_CACHE_TTL: float = float(os.getenv("USER_CACHE_TTL", "60"))
 
     HUGGING_FACE_TOKEN: str = os.getenv("HUGGING_FACE_TOKEN", "")
 
+    # AI generation: "nebius" or "fake" (local, no network) provider, and the job workers
+    AI_PROVIDER: str = os.getenv("AI_PROVIDER", "nebius").lower()
+    AI_MODEL: str = os.getenv("AI_MODEL", "black-forest-labs/FLUX.1-dev")
+    FAKE_AI_LATENCY: float = float(os.getenv("FAKE_AI_LATENCY", "0"))
+    AI_JOB_WORKERS: int = int(os.getenv("AI_JOB_WORKERS", "2"))
+    # Jobs running at once per user, and queued plus running jobs per user / overall
+    AI_JOB_USER_CONCURRENCY: int = int(os.getenv("AI_JOB_USER_CONCURRENCY", "1"))
+    AI_JOB_USER_QUEUE_LIMIT: int = int(os.getenv("AI_JOB_USER_QUEUE_LIMIT", "5"))
+    AI_JOB_QUEUE_LIMIT: int = int(os.getenv("AI_JOB_QUEUE_LIMIT", "100"))
+    # A job still running after this many seconds is failed, or re-run if its process died
+    AI_JOB_TIMEOUT: float = float(os.getenv("AI_JOB_TIMEOUT", "300"))
+    AI_JOB_POLL_INTERVAL: float = float(os.getenv("AI_JOB_POLL_INTERVAL", "2"))
+    # Seeded generations reuse an earlier result for the same prompt; size 0 disables the cache
+    AI_CACHE_SIZE: int = int(os.getenv("AI_CACHE_SIZE", "1000"))
+    AI_CACHE_TTL: float = float(os.getenv("AI_CACHE_TTL", str(7 * 24 * 3600)))
+
+    # "Similar images": snapshot of the in-memory perceptual hash index ("" to disable) and
+    # the default Hamming distance; up to 7 bits only probes exact 16-bit chunk matches
+    SIMILAR_INDEX_PATH: str = os.getenv("SIMILAR_INDEX_PATH", "./similar_index.bin")
+    SIMILAR_MAX_DISTANCE: int = int(os.getenv("SIMILAR_MAX_DISTANCE", "7"))
+    # Images uploaded this recently (seconds) are looked for again, in case a smaller id commits late
+    SIMILAR_SETTLE_TIME: float = float(os.getenv("SIMILAR_SETTLE_TIME", "60"))
+
+    # Trending feed: event weights, how fast they decay, and the background job's rows per table per run
+    TRENDING_HALF_LIFE: float = float(os.getenv("TRENDING_HALF_LIFE", "24"))  # hours
+    TRENDING_UPLOAD_WEIGHT: float = float(os.getenv("TRENDING_UPLOAD_WEIGHT", "1"))
+    TRENDING_LIKE_WEIGHT: float = float(os.getenv("TRENDING_LIKE_WEIGHT", "1"))
+    TRENDING_COMMENT_WEIGHT: float = float(os.getenv("TRENDING_COMMENT_WEIGHT", "2"))
+    TRENDING_BATCH_SIZE: int = int(os.getenv("TRENDING_BATCH_SIZE", "2000"))
+    TRENDING_INTERVAL: float = float(os.getenv("TRENDING_INTERVAL", "30"))
+    # Rows younger than this (seconds) wait for the next run, so commits still in flight aren't skipped
+    TRENDING_SETTLE_TIME: float = float(os.getenv("TRENDING_SETTLE_TIME", "60"))
+
+    # Number of latest comments embedded per image in the public feed
+    FEED_COMMENT_PREVIEW: int = int(os.getenv("FEED_COMMENT_PREVIEW", "3"))
+    # Feed page cache (see feed_cache.py): pages per process (0 disables it), how long entries live,
+    # the shared store ("memory" for none, "local" or "redis"), and how long requests wait for another's refill
+    FEED_CACHE_SIZE: int = int(os.getenv("FEED_CACHE_SIZE", "1000"))
+    FEED_CACHE_TTL: float = float(os.getenv("FEED_CACHE_TTL", "300"))
+    FEED_CACHE_BACKEND: str = os.getenv("FEED_CACHE_BACKEND", "memory").lower()
+    FEED_CACHE_REDIS_URL: str = os.getenv("FEED_CACHE_REDIS_URL", "redis://localhost:6379/0")
+    FEED_CACHE_FILL_TIMEOUT: float = float(os.getenv("FEED_CACHE_FILL_TIMEOUT", "5"))
+
+    # Worker pools keeping Pillow and blocking network calls off the event loop
+    IMAGE_PROCESS_WORKERS: int = int(os.getenv("IMAGE_PROCESS_WORKERS", str(min(os.cpu_count() or 1, 4))))
+    IMAGE_QUEUE_LIMIT: int = int(os.getenv("IMAGE_QUEUE_LIMIT", "32"))
+    IO_THREAD_WORKERS: int = int(os.getenv("IO_THREAD_WORKERS", "16"))
+    IO_QUEUE_LIMIT: int = int(os.getenv("IO_QUEUE_LIMIT", "128"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+    PASSWORD_HASH_QUEUE_LIMIT: int = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "64"))
+    # /metrics answers only requests sending "Authorization: Bearer <METRICS_TOKEN>"; unset, it is off
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+
+    # bcrypt cost factor; existing hashes are upgraded on login when it changes
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
 settings = Settings()
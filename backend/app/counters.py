@@ -0,0 +1,61 @@
+"""
+Reconcile the denormalized like_count / comment_count columns on images.
+
+Run from the backend directory with:
+
+    python -m app.counters [batch_size]
+"""
+import sys
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from . import models
+from .database import SessionLocal
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def reconcile_image_counters(db: Session, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Recompute like_count and comment_count from the likes/comments tables.
+
+    Works through images in id order, one batch per transaction, so large
+    tables never hold a long lock. Returns the number of images processed.
+    """
+    like_count = select(func.count(models.Like.id)).where(
+        models.Like.image_id == models.Image.id
+    ).correlate(models.Image).scalar_subquery()
+    comment_count = select(func.count(models.Comment.id)).where(
+        models.Comment.image_id == models.Image.id
+    ).correlate(models.Image).scalar_subquery()
+
+    processed = 0
+    last_id = 0
+    while True:
+        batch_ids = [image_id for (image_id,) in db.query(models.Image.id).filter(
+            models.Image.id > last_id
+        ).order_by(models.Image.id).limit(batch_size).all()]
+        if not batch_ids:
+            break
+
+        db.query(models.Image).filter(
+            models.Image.id.between(batch_ids[0], batch_ids[-1])
+        ).update(
+            {models.Image.like_count: like_count, models.Image.comment_count: comment_count},
+            synchronize_session=False
+        )
+        db.commit()
+
+        processed += len(batch_ids)
+        last_id = batch_ids[-1]
+        print(f"🔢 Reconciled counters for {processed} images")
+
+    return processed
+
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_SIZE
+    db = SessionLocal()
+    try:
+        reconcile_image_counters(db, batch_size)
+    finally:
+        db.close()
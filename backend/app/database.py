@@ -1,21 +1,91 @@
-import os
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event, exc
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from .config import settings
 
-if os.getenv("DATABASE_URL"):
-    DATABASE_URL = os.getenv("DATABASE_URL").replace("postgres://", "postgresql://", 1)
-    engine = create_engine(DATABASE_URL)
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how many checkouts there were and how long they waited"""
+
+    stats_lock = threading.Lock()
+    checkouts = 0
+    timeouts = 0
+    wait_total = 0.0
+    wait_max = 0.0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with self.stats_lock:
+                InstrumentedQueuePool.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self.stats_lock:
+                InstrumentedQueuePool.checkouts += 1
+                InstrumentedQueuePool.wait_total += waited
+                InstrumentedQueuePool.wait_max = max(InstrumentedQueuePool.wait_max, waited)
+
+
+DATABASE_URL = settings.DATABASE_URL
+is_sqlite = DATABASE_URL.startswith("sqlite")
+
+# Sized for the request threadpool: every sync endpoint holds at most one connection
+pool_args = {
+    "poolclass": InstrumentedQueuePool,
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+}
+
+if is_sqlite:
+    engine = create_engine(
+        DATABASE_URL, connect_args={"check_same_thread": False}, **pool_args
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside the writer; busy_timeout makes writers queue instead of failing
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT}")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        cursor.close()
 else:
-    SQLITE_DATABASE_URL = "sqlite:///./image_gallery.db"
+    # Pre-ping and recycle replace connections a proxy or the server has dropped
     engine = create_engine(
-        SQLITE_DATABASE_URL, connect_args={"check_same_thread": False}
+        DATABASE_URL,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        **pool_args
     )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def pool_stats():
+    pool = engine.pool
+    with InstrumentedQueuePool.stats_lock:
+        checkouts = InstrumentedQueuePool.checkouts
+        return {
+            "backend": engine.dialect.name,
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": checkouts,
+            "timeouts": InstrumentedQueuePool.timeouts,
+            "wait_avg_ms": round(InstrumentedQueuePool.wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+            "wait_max_ms": round(InstrumentedQueuePool.wait_max * 1000, 3),
+        }
+
+
 # Add this function - it was missing
 def get_db():
     db = SessionLocal()
@@ -0,0 +1,327 @@
+"""
+Cache of public feed pages.
+
+A feed page is the same for every user apart from is_liked, so the page
+itself (images with their owners and comment previews, plus the next
+cursor) is cached once, and each request only overlays is_liked from one
+small lookup.
+
+Entries aren't deleted on writes; each one records the versions (see
+versions.py) of everything it shows:
+
+    "image:<id>"    every image on it: its counts, comment previews, or deletion
+    "profile:<id>"  every owner and commenter whose name is on it
+    "feed:recent"   for recent pages without a cursor, which public images shift when added or deleted
+    "feed:trending" for trending pages, reordered by each trending job run
+
+and is served only while those are unchanged, checked with one query per
+hit. upload_image, delete_image, toggle_like and add_comment bump exactly
+those versions in their own transactions, so an entry never outlives a
+write that changed it, in this process or any other, and a like only
+rebuilds the pages its image is on. Pages after a cursor never gain newer
+images, so uploads leave them alone.
+
+A rebuilt page is only trusted if none of its versions moved between
+before and after the build; writes elsewhere on the site don't matter. A
+page showing something it didn't last time has no "before" for it yet, so
+it is kept unverified and the next rebuild is compared against it.
+
+Pages are kept in a per-process LRU (TTLCache) in front of an optional
+shared store picked by FEED_CACHE_BACKEND:
+
+    "memory"  no shared store (default)
+    "local"   an in-process stand-in for one, storing encoded entries like a real one; for tests
+    "redis"   Redis at FEED_CACHE_REDIS_URL (needs the redis package)
+
+A shared store implements get(key), set(key, value, ttl), delete(key) and
+add(key, value, ttl), which only sets a missing key and says whether it did.
+
+Only one request rebuilds a missing, expired or stale page; the others
+wait for it, up to FEED_CACHE_FILL_TIMEOUT seconds, on a lock per page in
+this process and, across processes, on a lock key in the shared store.
+Requests that were waiting when that rebuild started get its result even
+when it couldn't be cached.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from .cache import TTLCache
+from .config import settings
+from .serialization import dumps, loads
+from .versions import get_versions, image_scope, profile_scope
+
+KEY_PREFIX = "feedpage:"
+POLL_INTERVAL = 0.05
+
+
+class LocalStore:
+    """In-process stand-in for a shared store: bytes values that expire, and an atomic add"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            return entry[1] if entry else None
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def add(self, key, value, ttl):
+        with self._lock:
+            now = time.monotonic()
+            if self._live(key, now):
+                return False
+            self._entries[key] = (now + ttl, value)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisStore:
+    """
+    Redis as the shared store. Errors are logged and treated as misses, and
+    a failed add as a lock taken, so the feed keeps working without Redis.
+    """
+
+    def __init__(self, url):
+        import redis
+        self._errors = redis.RedisError
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        try:
+            return self._client.get(key)
+        except self._errors as e:
+            print(f"⚠️ Warning: feed cache read failed: {e}")
+            return None
+
+    def set(self, key, value, ttl):
+        try:
+            self._client.set(key, value, px=int(ttl * 1000))
+        except self._errors as e:
+            print(f"⚠️ Warning: feed cache write failed: {e}")
+
+    def add(self, key, value, ttl):
+        try:
+            return bool(self._client.set(key, value, px=int(ttl * 1000), nx=True))
+        except self._errors as e:
+            print(f"⚠️ Warning: feed cache lock failed: {e}")
+            return True
+
+    def delete(self, key):
+        try:
+            self._client.delete(key)
+        except self._errors as e:
+            print(f"⚠️ Warning: feed cache delete failed: {e}")
+
+
+def page_scopes(images, scopes):
+    """The versions a page of serialized images depends on, besides its position scopes"""
+    depends = set(scopes)
+    for image in images:
+        depends.add(image_scope(image["id"]))
+        depends.add(profile_scope(image["owner"]["id"]))
+        depends.update(profile_scope(comment["user"]["id"]) for comment in image.get("comments", []))
+    return sorted(depends)
+
+
+class _Fill:
+    """One page's fill lock, and the last build made under it that couldn't be cached"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+        self.started = 0
+        self.uncached = None  # (build number, entry)
+
+
+class FeedPageCache:
+    """Feed pages by key, validated against the versions they depend on"""
+
+    def __init__(self, local, shared, ttl, fill_timeout):
+        self.local = local
+        self.shared = shared
+        self.ttl = ttl
+        self.fill_timeout = fill_timeout
+        self._fills_lock = threading.Lock()
+        self._fills = {}  # key -> _Fill, while requests hold or wait for it
+        self._hits = 0
+        self._misses = 0
+        self._builds = 0
+        self._waited = 0
+        self._uncached = 0
+
+    @property
+    def enabled(self):
+        return self.local.max_size > 0 or self.shared is not None
+
+    def _lookup(self, key):
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            data = self.shared.get(KEY_PREFIX + key)
+            if data is not None:
+                entry = loads(data)
+                self.local.set(key, entry)
+        return entry
+
+    def _store(self, key, entry):
+        self.local.set(key, entry)
+        if self.shared is not None:
+            self.shared.set(KEY_PREFIX + key, dumps(entry), self.ttl)
+
+    def _is_current(self, db, entry):
+        return entry["versions"] is not None and get_versions(db, entry["scopes"]) == entry["versions"]
+
+    @contextmanager
+    def _fill_lock(self, key):
+        """
+        Hold this process's lock for key, or give up waiting after
+        fill_timeout. Yields the _Fill if the lock was taken (else None) and
+        how many builds it had started when this request arrived.
+        """
+        with self._fills_lock:
+            fill = self._fills.get(key)
+            if fill is None:
+                fill = self._fills[key] = _Fill()
+            fill.users += 1
+            arrived = fill.started
+        acquired = fill.lock.acquire(timeout=self.fill_timeout)
+        try:
+            yield (fill if acquired else None), arrived
+        finally:
+            if acquired:
+                fill.lock.release()
+            with self._fills_lock:
+                fill.users -= 1
+                if not fill.users:
+                    del self._fills[key]
+
+    def _wait_for_shared_fill(self, db, key):
+        """Poll the shared store until another process stores a current entry for key, or time runs out"""
+        deadline = time.monotonic() + self.fill_timeout
+        seen = None
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            data = self.shared.get(KEY_PREFIX + key)
+            if data is not None and data != seen:
+                seen = data
+                entry = loads(data)
+                if self._is_current(db, entry):
+                    self.local.set(key, entry)
+                    return entry
+        return None
+
+    def _build(self, db, key, build, known, fill):
+        """
+        Build and cache the page. known are the scopes the page showed last
+        time: their versions are read before the build and compared after it.
+        """
+        self._builds += 1
+        if fill is not None:
+            fill.started += 1
+            number = fill.started
+        before = dict(zip(known, get_versions(db, known))) if known else {}
+        images, next_cursor, scopes = build()
+        scopes = page_scopes(images, scopes)
+        versions = get_versions(db, scopes)
+        entry = {"images": images, "next_cursor": next_cursor, "scopes": scopes, "versions": versions}
+
+        # A scope that moved during the build may or may not be reflected in the page, and one
+        # the page didn't show last time wasn't read before it; either way the versions can't be
+        # trusted. The page is kept unverified, so the next build knows what to compare.
+        if any(before.get(scope) != version for scope, version in zip(scopes, versions)):
+            self._uncached += 1
+            self._store(key, {**entry, "versions": None})
+            if fill is not None:
+                fill.uncached = (number, entry)
+            return entry
+
+        self._store(key, entry)
+        if fill is not None:
+            fill.uncached = None
+        return entry
+
+    def page(self, db, key, build):
+        """
+        The current page for key as {"images", "next_cursor", ...}. On a miss,
+        build() returns (images without is_liked, next cursor, the "feed:*"
+        versions the page's position depends on) and the result is cached.
+        """
+        if not self.enabled:
+            images, next_cursor, _ = build()
+            return {"images": images, "next_cursor": next_cursor}
+
+        entry = self._lookup(key)
+        if entry is not None and self._is_current(db, entry):
+            self._hits += 1
+            return entry
+        self._misses += 1
+        known = entry["scopes"] if entry is not None else []
+
+        with self._fill_lock(key) as (fill, arrived):
+            # Another request may have rebuilt it while this one waited
+            fresh = self._lookup(key)
+            if fresh is not None and fresh is not entry and self._is_current(db, fresh):
+                self._waited += 1
+                return fresh
+            # A build started after this request arrived is as fresh as its own would be
+            if fill is not None and fill.uncached is not None and fill.uncached[0] > arrived:
+                self._waited += 1
+                return fill.uncached[1]
+            if fresh is not None:
+                known = fresh["scopes"]
+
+            lock_key = f"{KEY_PREFIX}{key}:fill"
+            if self.shared is not None and not self.shared.add(lock_key, b"1", self.fill_timeout):
+                fresh = self._wait_for_shared_fill(db, key)
+                if fresh is not None:
+                    self._waited += 1
+                    return fresh
+                return self._build(db, key, build, known, fill)
+
+            try:
+                return self._build(db, key, build, known, fill)
+            finally:
+                if self.shared is not None:
+                    self.shared.delete(lock_key)
+
+    def stats(self):
+        return {
+            "backend": settings.FEED_CACHE_BACKEND,
+            "pages": self.local.stats(),
+            "hits": self._hits,
+            "misses": self._misses,
+            "builds": self._builds,
+            "waited": self._waited,
+            "uncached": self._uncached,
+        }
+
+
+def create_shared_store():
+    if settings.FEED_CACHE_BACKEND == "redis":
+        print(f"🗄️ Caching feed pages in Redis at {settings.FEED_CACHE_REDIS_URL}")
+        return RedisStore(settings.FEED_CACHE_REDIS_URL)
+    if settings.FEED_CACHE_BACKEND == "local":
+        return LocalStore()
+    return None
+
+
+feed_cache = FeedPageCache(
+    local=TTLCache(max_size=settings.FEED_CACHE_SIZE, ttl=settings.FEED_CACHE_TTL),
+    shared=create_shared_store(),
+    ttl=settings.FEED_CACHE_TTL,
+    fill_timeout=settings.FEED_CACHE_FILL_TIMEOUT,
+)
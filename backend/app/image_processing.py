@@ -0,0 +1,257 @@
+"""
+CPU-bound Pillow work.
+
+Everything here is a plain module-level function so it can be shipped to the
+image process pool (see workers.py) and never runs on the event loop.
+"""
+import io
+import math
+from datetime import datetime
+from PIL import Image, ExifTags
+from .config import settings
+
+THUMBNAIL_SIZE = (300, 300)
+
+# Encoder settings per derivative format
+DERIVATIVE_ENCODERS = {
+    "avif": ("AVIF", {"quality": 60}),
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def _thumbnail_from(img, size=THUMBNAIL_SIZE):
+    img.thumbnail(size)
+    thumb_buffer = io.BytesIO()
+
+    # Convert to appropriate format
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGB')
+        img.save(thumb_buffer, format="JPEG", quality=85)
+    else:
+        img.save(thumb_buffer, format="WEBP", quality=85)
+
+    return thumb_buffer.getvalue()
+
+
+def generate_thumbnail(image_data, size=THUMBNAIL_SIZE):
+    """Generate thumbnail from image data"""
+    try:
+        with Image.open(io.BytesIO(image_data)) as img:
+            return _thumbnail_from(img, size)
+    except Exception as e:
+        print(f"❌ Error generating thumbnail: {e}")
+        return None
+
+
+def derivative_formats():
+    """Configured derivative formats this Pillow build can actually encode"""
+    Image.init()
+    return [
+        fmt for fmt in settings.DERIVATIVE_FORMATS
+        if fmt in DERIVATIVE_ENCODERS and DERIVATIVE_ENCODERS[fmt][0] in Image.SAVE
+    ]
+
+
+def _target_widths(width):
+    # Never upscale; the original already covers anything wider
+    return sorted({w for w in settings.DERIVATIVE_WIDTHS if 0 < w < width}, reverse=True)
+
+
+def _decode_once(img, widths):
+    """
+    Decode the pixels a single time, at the smallest scale that still covers
+    the largest derivative (and the thumbnail).
+
+    For JPEG, draft() lets libjpeg decode at 1/2, 1/4 or 1/8 scale, so a
+    40 MP photo never has to be fully expanded in memory.
+    """
+    width, height = img.size
+    target_width = max(widths + [THUMBNAIL_SIZE[0]])
+    target_height = max(-(-height * target_width // width), THUMBNAIL_SIZE[1])
+    if img.format == "JPEG":
+        img.draft("RGB" if img.mode not in ("L", "CMYK") else img.mode, (target_width, target_height))
+    img.load()
+
+    if img.mode not in ("RGB", "RGBA"):
+        has_alpha = img.mode in ("LA", "PA") or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+    return img
+
+
+def _render_derivatives(base, width, height, widths):
+    derivatives = []
+    formats = derivative_formats()
+    for target_width in widths:
+        target_height = max(round(height * target_width / width), 1)
+        # reducing_gap makes Pillow use the cheap reduce() step before resampling
+        resized = base.resize((target_width, target_height), Image.LANCZOS, reducing_gap=3.0)
+        for fmt in formats:
+            pil_format, options = DERIVATIVE_ENCODERS[fmt]
+            frame = resized.convert("RGB") if pil_format == "JPEG" and resized.mode != "RGB" else resized
+            buffer = io.BytesIO()
+            frame.save(buffer, format=pil_format, **options)
+            derivatives.append({
+                "width": target_width,
+                "height": target_height,
+                "format": fmt,
+                "data": buffer.getvalue(),
+            })
+    return derivatives
+
+
+def perceptual_hash(img):
+    """
+    64-bit difference hash (dHash) of an image, as a signed integer for a
+    BIGINT column. Resized and re-encoded copies of the same picture land
+    within a few bits of each other.
+    """
+    small = img.convert("L").resize((9, 8), Image.LANCZOS, reducing_gap=2.0)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            bits = (bits << 1) | (left > pixels[row * 9 + col + 1])
+    return bits - (1 << 64) if bits >= 1 << 63 else bits
+
+
+def perceptual_hash_bytes(image_data):
+    """perceptual_hash of encoded image bytes, or None if they can't be decoded"""
+    try:
+        with Image.open(io.BytesIO(image_data)) as img:
+            img.draft("L", (64, 64))  # JPEGs only need decoding at a fraction of their size
+            return perceptual_hash(img)
+    except Exception as e:
+        print(f"❌ Error hashing image: {e}")
+        return None
+
+
+def _process_decoded(img):
+    width, height = img.size
+    widths = _target_widths(width)
+    base = _decode_once(img, widths)
+    try:
+        thumbnail_data = _thumbnail_from(base.copy())
+    except Exception as e:
+        print(f"❌ Error generating thumbnail: {e}")
+        thumbnail_data = None
+    derivatives = _render_derivatives(base, width, height, widths)
+    return width, height, thumbnail_data, derivatives, perceptual_hash(base)
+
+
+def _exif_value(value):
+    """A JSON-safe version of an EXIF value, or None for binary and unreadable values"""
+    if isinstance(value, str):
+        return value.strip("\x00 ")[:256] or None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return value
+    if isinstance(value, tuple):
+        values = [_exif_value(item) for item in value]
+        return values if values and None not in values else None
+    try:
+        number = float(value)  # IFDRational and friends
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+# Offsets of the nested IFDs, which are read separately
+_IFD_POINTERS = {int(ifd) for ifd in ExifTags.IFD}
+
+
+def _exif_tags(tags, names):
+    readable = {}
+    for tag, value in tags.items():
+        if tag in _IFD_POINTERS:
+            continue
+        name = names.get(tag)
+        value = _exif_value(value)
+        if name and value is not None:
+            readable[name] = value
+    return readable
+
+
+def _gps_coordinate(degrees_minutes_seconds, ref):
+    if not isinstance(degrees_minutes_seconds, list) or len(degrees_minutes_seconds) != 3:
+        return None
+    degrees, minutes, seconds = degrees_minutes_seconds
+    coordinate = degrees + minutes / 60 + seconds / 3600
+    return -coordinate if ref in ("S", "W") else coordinate
+
+
+def _exif_datetime(value):
+    try:
+        return datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+
+
+# Image columns filled from the original's EXIF metadata
+EXIF_COLUMNS = [
+    "exif_data", "camera_make", "camera_model", "taken_at",
+    "focal_length", "gps_latitude", "gps_longitude",
+]
+
+
+def extract_exif(img):
+    """
+    Return the image's EXIF metadata as Image columns: exif_data (readable
+    tags, GPS under "GPS") plus the facet columns camera_make, camera_model,
+    taken_at, focal_length, gps_latitude and gps_longitude.
+
+    Every column is always present (None when unknown), so rows built from
+    different files can share one multi-row INSERT. Only the metadata
+    segment is parsed; no pixels are decoded.
+    """
+    empty = dict.fromkeys(EXIF_COLUMNS)
+    try:
+        exif = img.getexif()
+        tags = _exif_tags(exif, ExifTags.TAGS)
+        tags.update(_exif_tags(exif.get_ifd(ExifTags.IFD.Exif), ExifTags.TAGS))
+        gps = _exif_tags(exif.get_ifd(ExifTags.IFD.GPSInfo), ExifTags.GPSTAGS)
+    except Exception as e:
+        print(f"⚠️ Warning: unreadable EXIF data: {e}")
+        return empty
+    if not tags and not gps:
+        return empty
+
+    latitude = _gps_coordinate(gps.get("GPSLatitude"), gps.get("GPSLatitudeRef"))
+    longitude = _gps_coordinate(gps.get("GPSLongitude"), gps.get("GPSLongitudeRef"))
+    focal_length = tags.get("FocalLength")
+    return {
+        "exif_data": {**tags, "GPS": gps} if gps else tags,
+        "camera_make": tags.get("Make"),
+        "camera_model": tags.get("Model"),
+        "taken_at": _exif_datetime(tags.get("DateTimeOriginal")) or _exif_datetime(tags.get("DateTime")),
+        "focal_length": focal_length if isinstance(focal_length, (int, float)) else None,
+        "gps_latitude": latitude if latitude is not None and -90 <= latitude <= 90 else None,
+        "gps_longitude": longitude if longitude is not None and -180 <= longitude <= 180 else None,
+    }
+
+
+def process_upload_file(path):
+    """
+    Read an uploaded image from disk and return
+    (width, height, thumbnail_bytes, derivatives, perceptual_hash, exif),
+    all from one decode. Each derivative is a dict with width, height, format
+    and encoded data; exif holds the metadata columns from extract_exif.
+    """
+    with Image.open(path) as img:
+        # Image.open only parses the header, so the size and EXIF are known before any decode
+        exif = extract_exif(img)
+        return (*_process_decoded(img), exif)
+
+
+def encode_png(image):
+    """Encode a generated PIL image as PNG bytes"""
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='PNG')
+    return img_byte_arr.getvalue()
+
+
+def process_generated(image):
+    """Return (width, height, thumbnail_bytes, derivatives, perceptual_hash) for an already decoded PIL image"""
+    return _process_decoded(image)
@@ -1,68 +1,424 @@
 # [file name]: images.py
 # [file content begin]
 import os
+import re
 import uuid
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session, joinedload
-from PIL import Image as PILImage
-import io
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
+from sqlalchemy import select, func, inspect, case, delete, update, insert, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload, object_session
+from datetime import datetime
+from typing import List, Optional
 from . import models, schemas
-from .database import get_db
+from .database import SessionLocal, get_db
 from .auth import get_current_user
-from .cloudinary_client import cloudinary_client
+from .storage import storage
+from .pagination import NEXT_CURSOR_HEADER, paginate, paginate_images, paginate_ranked
+from .search import search_images, facet_filters, facet_counts, visible_to
+from .similarity import similarity_index
+from .workers import image_executor, io_executor
+from . import image_processing
+from .ingest import spool_upload
+from .outbox import queue_storage_deletions, storage_deletion_worker
+from .feed_cache import feed_cache
+from .versions import GLOBAL, FEED_RECENT, FEED_TRENDING, user_scope, image_scopes, new_image_scopes, deleted_image_scopes, bump_versions, not_modified
+from .serialization import IMAGE_COLUMNS, OWNER_COLUMNS, serialize_image_row, serialize_comment, fast_json_response
+from functools import partial
+import asyncio
 import requests
-from io import BytesIO
 import base64
 from .config import settings
-from huggingface_hub import InferenceClient
 import time
 # Make sure the router is defined at the top level
 router = APIRouter()
 
+def get_liked_image_ids(db: Session, image_ids, current_user_id=None):
+    """
+    Return the subset of image_ids the current user has liked, in one query.
+
+    Like and comment counts are stored on the image row itself, so this is
+    the only per-user lookup a list page needs.
+    """
+    if not image_ids or not current_user_id:
+        return set()
+
+    rows = db.query(models.Like.image_id).filter(
+        models.Like.user_id == current_user_id,
+        models.Like.image_id.in_(image_ids)
+    ).all()
+    return {image_id for (image_id,) in rows}
+
+def get_comment_previews(db: Session, image_ids, per_image):
+    """
+    Fetch the latest `per_image` comments for each image with one window-function query.
+
+    Returns a dict of image id -> comments, oldest first within the preview.
+    """
+    if not image_ids or per_image <= 0:
+        return {}
+
+    ranked = select(
+        models.Comment.id,
+        func.row_number().over(
+            partition_by=models.Comment.image_id,
+            order_by=(models.Comment.created_at.desc(), models.Comment.id.desc())
+        ).label("rank")
+    ).where(models.Comment.image_id.in_(image_ids)).subquery()
+
+    comments = db.query(models.Comment).join(
+        ranked, models.Comment.id == ranked.c.id
+    ).filter(
+        ranked.c.rank <= per_image
+    ).options(
+        joinedload(models.Comment.user)
+    ).order_by(models.Comment.created_at, models.Comment.id).all()
+
+    previews = {}
+    for comment in comments:
+        previews.setdefault(comment.image_id, []).append(comment)
+    return previews
+
 # Helper function to add like and comment counts to image
-def add_image_counts(image, current_user_id=None):
+def add_image_counts(image, current_user_id=None, liked_ids=None, comments=None):
     """Add like_count, is_liked, and comment_count to image object"""
+    # like_count and comment_count are columns, so they come along here
     image_dict = {c.name: getattr(image, c.name) for c in image.__table__.columns}
     
-    # Add like count
-    image_dict['like_count'] = len(image.likes)
-    
-    # Add is_liked status if user is provided
-    if current_user_id:
-        image_dict['is_liked'] = any(like.user_id == current_user_id for like in image.likes)
-    else:
-        image_dict['is_liked'] = False
-        
-    # Add comment count
-    image_dict['comment_count'] = len(image.comments)
+    # Look up is_liked for this image alone unless the caller batched it
+    if liked_ids is None:
+        liked_ids = get_liked_image_ids(object_session(image), [image.id], current_user_id)
+    image_dict['is_liked'] = image.id in liked_ids
     
-    # Add owner information if available
-    if hasattr(image, 'owner') and image.owner:
+    # Add owner information if the query already loaded it, never lazy-load it here
+    if 'owner' not in inspect(image).unloaded and image.owner:
         image_dict['owner'] = image.owner
     
-    # Add comments if available
-    if hasattr(image, 'comments') and image.comments:
-        image_dict['comments'] = image.comments
+    # Add comment preview if the caller fetched one
+    if comments:
+        image_dict['comments'] = comments
     
     return image_dict
 
+async def upload_to_storage(original_data, original_public_id, thumbnail_data, thumbnail_public_id, derivatives=()):
+    """
+    Upload an original, its thumbnail and any derivatives concurrently.
+
+    Returns (original_result, thumbnail_result, derivative_records), with None
+    for a failed original/thumbnail upload. If either of those fails, every
+    upload that did succeed is deleted again, so callers just check the two
+    results and never leave half an upload behind in storage. A failed
+    derivative is only dropped; clients fall back to the original.
+    """
+    derivative_ids = [
+        f"derivatives/{uuid.uuid4()}_{derivative['width']}w.{derivative['format']}"
+        for derivative in derivatives
+    ]
+    uploads = [(original_data, original_public_id), (thumbnail_data, thumbnail_public_id)]
+    uploads += [(derivative["data"], public_id) for derivative, public_id in zip(derivatives, derivative_ids)]
+    
+    results = await asyncio.gather(
+        *[io_executor.run(storage.upload_image, data, public_id) for data, public_id in uploads],
+        return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    results = [None if isinstance(result, BaseException) else result for result in results]
+    original_result, thumbnail_result = results[:2]
+    
+    if not original_result or not thumbnail_result:
+        for result, (_, public_id) in zip(results, uploads):
+            if result:
+                await io_executor.run(storage.delete_image, public_id)
+        if errors:
+            raise errors[0]
+        return original_result, thumbnail_result, []
+    
+    derivative_records = [
+        {
+            "width": derivative["width"],
+            "height": derivative["height"],
+            "format": derivative["format"],
+            "url": result["secure_url"],
+            "public_id": public_id,
+        }
+        for derivative, public_id, result in zip(derivatives, derivative_ids, results[2:])
+        if result
+    ]
+    if len(derivative_records) < len(derivatives):
+        print(f"⚠️ Warning: {len(derivatives) - len(derivative_records)} derivative uploads failed")
+    
+    return original_result, thumbnail_result, derivative_records
+
+def find_stored_duplicate(db: Session, content_hash):
+    """Return an existing image with exactly these bytes, if any (content_hash is indexed)"""
+    return db.query(models.Image).filter(
+        models.Image.content_hash == content_hash
+    ).order_by(models.Image.id).first()
+
+def stored_duplicate_asset(content_hash):
+    """
+    The asset columns of an image already stored with these bytes, or None.
+    Uses its own session, so it can run in the io executor.
+    """
+    db = SessionLocal()
+    try:
+        existing = find_stored_duplicate(db, content_hash)
+        if not existing:
+            return None
+        print(f"♻️ Reusing image {existing.id}'s stored files")
+        return stored_asset_fields(existing)
+    finally:
+        db.close()
+
+def stored_asset_fields(image):
+    """The columns describing an image's stored files, to share them with a new row"""
+    return {
+        "filename": image.filename,
+        "file_path": image.file_path,
+        "thumbnail_path": image.thumbnail_path,
+        "thumbnail_public_id": image.thumbnail_public_id,
+        "file_size": image.file_size,
+        "width": image.width,
+        "height": image.height,
+        "derivatives": image.derivatives,
+        "content_hash": image.content_hash,
+        "perceptual_hash": image.perceptual_hash,
+        # Same bytes, same metadata
+        **{column: getattr(image, column) for column in image_processing.EXIF_COLUMNS},
+    }
+
+# Rows from before thumbnail_public_id was stored: recover it from the Cloudinary URL
+_LEGACY_THUMBNAIL_ID = re.compile(r"/upload/(?:v\d+/)?((?:ai-)?thumbnails/[^/.]+)")
+
+def stored_public_ids(image):
+    """Every storage public_id belonging to an image: original, thumbnail and derivatives"""
+    public_ids = [image.filename]
+    thumbnail_public_id = image.thumbnail_public_id
+    if not thumbnail_public_id and image.thumbnail_path:
+        match = _LEGACY_THUMBNAIL_ID.search(image.thumbnail_path)
+        thumbnail_public_id = match.group(1) if match else None
+    if thumbnail_public_id:
+        public_ids.append(thumbnail_public_id)
+    public_ids += [derivative["public_id"] for derivative in image.derivatives or [] if derivative.get("public_id")]
+    return public_ids
+
+def delete_images_and_files(db: Session, images):
+    """
+    Delete image rows (with their likes and comments) in bulk and queue their
+    stored files for deletion, skipping files a remaining row still shares.
+    The caller commits; the files are removed by the background outbox worker.
+    """
+    image_ids = [image.id for image in images]
+    if not image_ids:
+        return
+
+    db.query(models.Like).filter(models.Like.image_id.in_(image_ids)).delete(synchronize_session=False)
+    db.query(models.Comment).filter(models.Comment.image_id.in_(image_ids)).delete(synchronize_session=False)
+    db.query(models.AIJob).filter(models.AIJob.image_id.in_(image_ids)).update(
+        {models.AIJob.image_id: None}, synchronize_session=False
+    )
+    db.query(models.TrendingScore).filter(models.TrendingScore.image_id.in_(image_ids)).delete(synchronize_session=False)
+    db.query(models.Image).filter(models.Image.id.in_(image_ids)).delete(synchronize_session=False)
+
+    # Duplicate uploads share stored files; keep those still referenced
+    filenames = {image.filename for image in images}
+    still_used = {
+        filename for (filename,) in
+        db.query(models.Image.filename).filter(models.Image.filename.in_(filenames)).distinct()
+    }
+    bump_versions(db, [
+        scope for image in images for scope in deleted_image_scopes(image.uploaded_by, image.privacy, image.id)
+    ])
+
+    files = []
+    for image in images:
+        if image.filename in still_used:
+            continue
+        still_used.add(image.filename)
+        files += [(image.filename, public_id) for public_id in stored_public_ids(image)]
+    queue_storage_deletions(db, files)
+
+async def store_upload(upload, original_filename):
+    """Decode a spooled upload, push it and its derivatives to storage, and return the asset columns"""
+    # Generate unique public IDs
+    file_ext = os.path.splitext(original_filename)[1].lower()
+    original_public_id = f"images/{uuid.uuid4()}{file_ext}"
+    thumbnail_public_id = f"thumbnails/{uuid.uuid4()}"
+    
+    # Get image dimensions, thumbnail and srcset derivatives from one decode in the image worker pool
+    width, height, thumbnail_data, derivatives, phash, exif = await image_executor.run(
+        image_processing.process_upload_file, upload.path
+    )
+    print(f"📐 Image dimensions: {width}x{height}")
+    if not thumbnail_data:
+        raise HTTPException(status_code=500, detail="Failed to generate thumbnail")
+    
+    # Upload original (streamed from disk), thumbnail and derivatives to Cloudinary concurrently
+    print(f"☁️ Uploading original, thumbnail and {len(derivatives)} derivatives to Cloudinary...")
+    with upload.open() as original_file:
+        original_result, thumbnail_result, derivative_records = await upload_to_storage(
+            original_file, original_public_id, thumbnail_data, thumbnail_public_id, derivatives
+        )
+    
+    if not original_result:
+        raise HTTPException(status_code=500, detail="Failed to upload original to Cloudinary")
+    if not thumbnail_result:
+        raise HTTPException(status_code=500, detail="Failed to upload thumbnail to Cloudinary")
+    
+    print(f"✅ Original uploaded: {original_result['secure_url']}")
+    print(f"✅ Thumbnail uploaded: {thumbnail_result['secure_url']}")
+    
+    return {
+        "filename": original_public_id,
+        "file_path": original_result['secure_url'],
+        "thumbnail_path": thumbnail_result['secure_url'],
+        "thumbnail_public_id": thumbnail_public_id,
+        "file_size": upload.size,
+        "width": width,
+        "height": height,
+        "derivatives": derivative_records,
+        "content_hash": upload.sha256,
+        "perceptual_hash": phash,
+        **exif,
+    }
+
+def save_uploaded_image(record):
+    """
+    Insert one uploaded image and return it with its counts. Uses its own
+    session, so the upload handlers can run it in the io executor.
+    """
+    db = SessionLocal()
+    try:
+        db_image = models.Image(**record)
+        db.add(db_image)
+        bump_versions(db, new_image_scopes(record["uploaded_by"], record["privacy"]))
+        db.commit()
+        db.refresh(db_image)
+        # Nobody has liked an image that didn't exist a moment ago
+        return add_image_counts(db_image, liked_ids=set())
+    finally:
+        db.close()
+
+def save_uploaded_images(records):
+    """
+    Insert a batch of uploaded images with one multi-row INSERT, in its own
+    session, and return them with their counts in no particular order.
+    """
+    db = SessionLocal()
+    try:
+        # render_nulls keeps None values in the statement; otherwise rows are grouped by
+        # which columns they have set, and each group gets its own INSERT
+        images = db.scalars(
+            insert(models.Image).returning(models.Image).execution_options(render_nulls=True), records
+        ).all()
+        saved = [add_image_counts(image, liked_ids=set()) for image in images]
+        bump_versions(db, new_image_scopes(records[0]["uploaded_by"], records[0]["privacy"]))
+        db.commit()
+        return saved
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
 # Your endpoints here...
 @router.get("/images", response_model=List[schemas.Image])
 def get_images(
-    skip: int = 0,
-    limit: int = 100,
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0, deprecated=True),
+    limit: int = Query(100, ge=1, le=100),
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
-    images = db.query(models.Image).filter(
+    # Unchanged since the client's copy: answer 304 without querying the images
+    cached = not_modified(request, response, db, [user_scope(current_user.id)], "images", current_user.id)
+    if cached:
+        return cached
+    
+    # Plain column tuples rather than ORM objects; see serialization.py
+    query = db.query(*IMAGE_COLUMNS).filter(
         models.Image.uploaded_by == current_user.id
-    ).offset(skip).limit(limit).all()
+    )
+    rows = paginate_images(query, response, cursor=cursor, skip=skip, limit=limit)
     
-    # Add like and comment counts using our helper function
-    images_with_counts = [add_image_counts(image, current_user.id) for image in images]
+    # Counts are stored on each row; is_liked is looked up for the whole page in one query
+    liked_ids = get_liked_image_ids(db, [row.id for row in rows], current_user.id)
+    images_with_counts = [serialize_image_row(row, liked_ids) for row in rows]
     
-    return images_with_counts
+    return fast_json_response(images_with_counts, response)
+
+@router.get("/images/search", response_model=List[schemas.PublicImage])
+def search(
+    request: Request,
+    response: Response,
+    keyword: Optional[str] = Query(None, max_length=200),
+    camera_make: Optional[str] = None,
+    camera_model: Optional[str] = None,
+    taken_after: Optional[datetime] = None,
+    taken_before: Optional[datetime] = None,
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_lon: Optional[float] = Query(None, ge=-180, le=180),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """
+    Search the titles, captions and alt text of public images and your own,
+    best matches first, optionally narrowed by camera, date taken or (your own
+    images only) a min/max latitude and longitude box. Without a keyword the
+    filtered images come newest first. Pass the X-Next-Cursor header back as
+    `cursor` for the next page.
+    """
+    keyword = keyword.strip() if keyword else None
+    bbox = (min_lat, max_lat, min_lon, max_lon)
+    if any(value is not None for value in bbox) and None in bbox:
+        raise HTTPException(status_code=400, detail="A location filter needs min_lat, max_lat, min_lon and max_lon")
+    filters = facet_filters(
+        current_user.id, camera_make, camera_model, taken_after, taken_before,
+        bbox if None not in bbox else None
+    )
+    if not keyword and not filters:
+        raise HTTPException(status_code=400, detail="Give a keyword or a filter")
+
+    cached = not_modified(
+        request, response, db, [GLOBAL, user_scope(current_user.id)], "search", current_user.id
+    )
+    if cached:
+        return cached
+
+    rows = search_images(
+        db, response, keyword, current_user.id, [*IMAGE_COLUMNS, *OWNER_COLUMNS], filters,
+        cursor=cursor, limit=limit
+    )
+
+    liked_ids = get_liked_image_ids(db, [row.id for row in rows], current_user.id)
+    results = []
+    for row in rows:
+        image = serialize_image_row(row, liked_ids)
+        image["comments"] = []
+        results.append(image)
+
+    return fast_json_response(results, response)
+
+@router.get("/images/facets", response_model=schemas.ImageFacets)
+def get_image_facets(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """Image counts per camera make, camera model and year taken, for search filters"""
+    cached = not_modified(
+        request, response, db, [GLOBAL, user_scope(current_user.id)], "facets", current_user.id
+    )
+    if cached:
+        return cached
+    return facet_counts(db, current_user.id, limit)
 
 @router.post("/upload", response_model=schemas.ImageUploadResponse)
 async def upload_image(
@@ -71,7 +427,6 @@ async def upload_image(
     caption: str = Form(None),
     alt_text: str = Form(None),
     privacy: str = Form("public"),
-    db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
     try:
@@ -81,84 +436,35 @@ async def upload_image(
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
 
-        # Read file content
-        contents = await file.read()
-        if len(contents) == 0:
-            raise HTTPException(status_code=400, detail="Empty file")
-        
-        print(f"📁 File received: {file.filename}, size: {len(contents)} bytes")
-        
-        # Generate unique public IDs
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        original_public_id = f"images/{uuid.uuid4()}{file_ext}"
-        thumbnail_public_id = f"thumbnails/{uuid.uuid4()}"
-        
-        # Get image dimensions
-        with PILImage.open(io.BytesIO(contents)) as img:
-            width, height = img.size
-            print(f"📐 Image dimensions: {width}x{height}")
+        # Stream the upload to a temp file instead of reading it into memory
+        upload = await spool_upload(file)
+        try:
+            if upload.size == 0:
+                raise HTTPException(status_code=400, detail="Empty file")
             
-            # Create thumbnail
-            thumbnail_data = cloudinary_client.generate_thumbnail(contents)
-            if not thumbnail_data:
-                raise HTTPException(status_code=500, detail="Failed to generate thumbnail")
-        
-        # Upload original image to Cloudinary
-        print("☁️ Uploading original to Cloudinary...")
-        original_result = cloudinary_client.upload_image(
-            io.BytesIO(contents).getvalue(),
-            original_public_id
-        )
-        
-        if not original_result:
-            raise HTTPException(status_code=500, detail="Failed to upload original to Cloudinary")
-        
-        print(f"✅ Original uploaded: {original_result['secure_url']}")
-        
-        # Upload thumbnail to Cloudinary
-        print("☁️ Uploading thumbnail to Cloudinary...")
-        thumbnail_result = cloudinary_client.upload_image(
-            thumbnail_data,
-            thumbnail_public_id
-        )
-        
-        if not thumbnail_result:
-            # Try to delete the original if thumbnail fails
-            cloudinary_client.delete_image(original_public_id)
-            raise HTTPException(status_code=500, detail="Failed to upload thumbnail to Cloudinary")
-        
-        print(f"✅ Thumbnail uploaded: {thumbnail_result['secure_url']}")
-        
-        # Get URLs
-        original_url = original_result['secure_url']
-        thumbnail_url = thumbnail_result['secure_url']
+            print(f"📁 File received: {file.filename}, size: {upload.size} bytes")
+            
+            # Identical bytes were stored before: reuse that original and its derivatives
+            asset = await io_executor.run(stored_duplicate_asset, upload.sha256)
+            if not asset:
+                asset = await store_upload(upload, file.filename)
+        finally:
+            upload.cleanup()
         
         # Create database record
-        db_image = models.Image(
-            filename=original_public_id,
-            original_filename=file.filename,
-            file_path=original_url,
-            thumbnail_path=thumbnail_url,
-            mime_type=file.content_type,
-            file_size=len(contents),
-            width=width,
-            height=height,
-            title=title,
-            caption=caption,
-            alt_text=alt_text,
-            privacy=privacy,
-            uploaded_by=current_user.id
-        )
-        
-        db.add(db_image)
-        db.commit()
-        db.refresh(db_image)
+        image_response = await io_executor.run(save_uploaded_image, {
+            **asset,
+            "original_filename": file.filename,
+            "mime_type": file.content_type,
+            "title": title,
+            "caption": caption,
+            "alt_text": alt_text,
+            "privacy": privacy,
+            "uploaded_by": current_user.id,
+        })
         
         print("💾 Database record created successfully")
         
-        # Convert to dict with counts
-        image_response = add_image_counts(db_image, current_user.id)
-        
         return {
             "success": True,
             "message": "Image uploaded successfully to Cloudinary",
@@ -175,6 +481,98 @@ async def upload_image(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error uploading image: {str(e)}")
 
+@router.post("/upload/batch", response_model=schemas.BatchUploadResponse)
+async def upload_images_batch(
+    files: List[UploadFile] = File(...),
+    privacy: str = Form("public"),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """
+    Upload many images in one request.
+
+    Files are processed in parallel (at most BATCH_UPLOAD_CONCURRENCY at a
+    time) and every file gets its own result, so one bad file doesn't fail
+    the rest. All rows are written with a single INSERT.
+    """
+    if len(files) > settings.MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files. Maximum is {settings.MAX_BATCH_FILES} per batch")
+    
+    print(f"📤 Starting batch upload of {len(files)} files for user {current_user.id}")
+    semaphore = asyncio.Semaphore(settings.BATCH_UPLOAD_CONCURRENCY)
+    # content hash -> future for its asset, so identical files in the batch are stored once
+    batch_assets = {}
+    
+    async def ingest(file):
+        if not (file.content_type or "").startswith('image/'):
+            raise HTTPException(status_code=400, detail="File must be an image")
+        
+        async with semaphore:
+            upload = await spool_upload(file)
+            try:
+                if upload.size == 0:
+                    raise HTTPException(status_code=400, detail="Empty file")
+                if upload.sha256 in batch_assets:
+                    return await asyncio.shield(batch_assets[upload.sha256])
+                
+                future = asyncio.get_running_loop().create_future()
+                batch_assets[upload.sha256] = future
+                try:
+                    asset = await io_executor.run(stored_duplicate_asset, upload.sha256)
+                    if not asset:
+                        asset = await store_upload(upload, file.filename)
+                except Exception as e:
+                    future.set_exception(e)
+                    future.exception()  # Mark retrieved in case no duplicate was waiting
+                    raise
+                future.set_result(asset)
+                return asset
+            finally:
+                upload.cleanup()
+    
+    outcomes = await asyncio.gather(*[ingest(file) for file in files], return_exceptions=True)
+    
+    results = []
+    records = []
+    for file, outcome in zip(files, outcomes):
+        if isinstance(outcome, HTTPException):
+            results.append({"filename": file.filename, "success": False, "error": outcome.detail})
+        elif isinstance(outcome, Exception):
+            print(f"❌ Error uploading {file.filename}: {outcome}")
+            results.append({"filename": file.filename, "success": False, "error": f"Error uploading image: {str(outcome)}"})
+        else:
+            results.append({"filename": file.filename, "success": True})
+            records.append({
+                **outcome,
+                "original_filename": file.filename,
+                "mime_type": file.content_type,
+                "privacy": privacy,
+                "uploaded_by": current_user.id,
+            })
+    
+    try:
+        images = await io_executor.run(save_uploaded_images, records) if records else []
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Error saving batch upload: {e}")
+        raise HTTPException(status_code=500, detail=f"Error saving uploaded images: {str(e)}")
+    
+    # RETURNING rows are matched back by content and name, since asking
+    # for parameter order makes SQLite insert row by row
+    pending = {}
+    for result, record in zip([result for result in results if result["success"]], records):
+        pending.setdefault((record["content_hash"], record["original_filename"]), []).append(result)
+    for image in images:
+        pending[(image["content_hash"], image["original_filename"])].pop()["image"] = image
+    
+    uploaded = len(records)
+    print(f"💾 Batch upload saved {uploaded} of {len(files)} images")
+    return {
+        "success": uploaded == len(files),
+        "message": f"Uploaded {uploaded} of {len(files)} images",
+        "results": results
+    }
+
 @router.delete("/images/{image_id}")
 def delete_image(
     image_id: int,
@@ -182,7 +580,7 @@ def delete_image(
     current_user: schemas.User = Depends(get_current_user)
 ):
     """
-    Delete an image and its thumbnail from Cloudinary and database
+    Delete an image; its original, thumbnail and derivatives are removed from storage in the background
     """
     try:
         # Find the image
@@ -194,25 +592,9 @@ def delete_image(
         if not image:
             raise HTTPException(status_code=404, detail="Image not found")
         
-        # Delete from Cloudinary
-        try:
-            # Extract public_id from stored filename
-            original_deleted = cloudinary_client.delete_image(image.filename)
-            # For thumbnail, we need to reconstruct the public_id pattern
-            # This assumes thumbnails are stored with the same public_id pattern
-            # You might need to adjust this based on your naming convention
-            thumbnail_public_id = image.filename.replace('images/', 'thumbnails/')
-            thumbnail_deleted = cloudinary_client.delete_image(thumbnail_public_id)
-            
-            if not original_deleted or not thumbnail_deleted:
-                print("⚠️ Warning: Could not delete images from Cloudinary")
-        except Exception as cloudinary_error:
-            print(f"⚠️ Cloudinary deletion error: {cloudinary_error}")
-            # Continue with database deletion even if Cloudinary deletion fails
-        
-        # Delete from database
-        db.delete(image)
+        delete_images_and_files(db, [image])
         db.commit()
+        storage_deletion_worker.wake()
         
         return {"success": True, "message": "Image deleted successfully"}
         
@@ -223,26 +605,157 @@ def delete_image(
         print(f"Error deleting image: {e}")
         raise HTTPException(status_code=500, detail=f"Error deleting image: {str(e)}")
 
+@router.post("/images/bulk-delete")
+def bulk_delete_images(
+    request: schemas.BulkDeleteRequest,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """Delete many of the current user's images at once; ids that aren't theirs are reported as not found"""
+    try:
+        images = db.query(models.Image).filter(
+            models.Image.id.in_(request.image_ids),
+            models.Image.uploaded_by == current_user.id
+        ).all()
+        
+        deleted = sorted(image.id for image in images)
+        delete_images_and_files(db, images)
+        db.commit()
+        storage_deletion_worker.wake()
+        
+        print(f"🗑️ Deleted {len(deleted)} images for user {current_user.id}")
+        return {
+            "success": True,
+            "message": f"Deleted {len(deleted)} images",
+            "deleted": deleted,
+            "not_found": sorted(set(request.image_ids) - set(deleted))
+        }
+    except Exception as e:
+        db.rollback()
+        print(f"Error deleting images: {e}")
+        raise HTTPException(status_code=500, detail=f"Error deleting images: {str(e)}")
+
 # NEW ENDPOINTS FOR FEED, LIKES, AND COMMENTS
 @router.get("/feed", response_model=List[schemas.PublicImage])
 def get_public_feed(
-    skip: int = 0,
-    limit: int = 100,
+    request: Request,
+    response: Response,
+    sort: str = Query("recent", pattern="^(recent|trending)$"),
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0, deprecated=True),
+    limit: int = Query(100, ge=1, le=100),
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user)
 ):
-    """Get public images from all users"""
-    images = db.query(models.Image).filter(
-        models.Image.privacy == "public"
-    ).options(
-        joinedload(models.Image.owner),
-        joinedload(models.Image.comments).joinedload(models.Comment.user)
-    ).offset(skip).limit(limit).all()
+    """
+    Get public images from all users, newest first, or with sort=trending by
+    their precomputed trending score (see trending.py). Pass the X-Next-Cursor
+    header back as `cursor` for the next page. Each image carries only its
+    latest few comments; the full list is paged through /images/{image_id}/comments.
+    """
+    # Unchanged since the client's copy: answer 304 without querying the feed
+    cached = not_modified(
+        request, response, db, [GLOBAL, user_scope(current_user.id)], "feed", current_user.id
+    )
+    if cached:
+        return cached
+    
+    # The page is the same for every user and cached (see feed_cache.py); only is_liked is looked up per user
+    page = feed_cache.page(
+        db, f"{sort}|{cursor or ''}|{skip}|{limit}",
+        partial(_build_feed_page, db, sort, cursor, skip, limit)
+    )
+    if page["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
+    liked_ids = get_liked_image_ids(db, [image["id"] for image in page["images"]], current_user.id)
+    images = [{**image, "is_liked": image["id"] in liked_ids} for image in page["images"]]
     
-    # Convert to dict with counts using our helper function
-    images_with_counts = [add_image_counts(image, current_user.id) for image in images]
+    return fast_json_response(images, response)
+
+def _build_feed_page(db: Session, sort, cursor, skip, limit):
+    """
+    One feed page for feed_cache: the serialized images without is_liked,
+    the next cursor, and the feed version the page's position depends on
+    """
+    page_response = Response()
+    # Image and owner columns as plain tuples from one join; see serialization.py
+    query = db.query(*IMAGE_COLUMNS, *OWNER_COLUMNS).join(
+        models.User, models.Image.uploaded_by == models.User.id
+    )
+    if sort == "trending":
+        # Only public images are scored, so pages come straight off the score index;
+        # images the trending job hasn't seen yet don't appear
+        query = query.add_columns(models.TrendingScore.score, models.TrendingScore.image_id).join(
+            models.TrendingScore, models.TrendingScore.image_id == models.Image.id
+        )
+        rows = paginate_ranked(
+            query, page_response, models.TrendingScore.score, models.TrendingScore.image_id,
+            cursor=cursor, limit=limit
+        )
+        scopes = [FEED_TRENDING]
+    else:
+        query = query.filter(models.Image.privacy == "public")
+        rows = paginate_images(query, page_response, cursor=cursor, skip=skip, limit=limit)
+        # New images only ever land on the pages before the first cursor
+        scopes = [] if cursor else [FEED_RECENT]
     
-    return images_with_counts
+    # Comment previews are fetched for the whole page at once
+    previews = get_comment_previews(db, [row.id for row in rows], settings.FEED_COMMENT_PREVIEW)
+    images = []
+    for row in rows:
+        image = serialize_image_row(row, liked_ids=())
+        image["comments"] = [serialize_comment(comment) for comment in previews.get(row.id, [])]
+        images.append(image)
+    return images, page_response.headers.get(NEXT_CURSOR_HEADER), scopes
+
+def _dialect_insert(db: Session, model):
+    """An INSERT supporting ON CONFLICT for the current database"""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+def apply_likes(db: Session, user_id: int, like_ids, unlike_ids):
+    """
+    Like like_ids and unlike unlike_ids for a user, one statement each.
+
+    Likes are only inserted for images that exist, and only rows actually
+    inserted or deleted move the like counters, so repeated or concurrent
+    requests can neither duplicate a like nor skew the counts. Returns the
+    ids whose state changed as (liked, unliked). The caller commits.
+    """
+    unliked = set()
+    if unlike_ids:
+        unliked = set(db.execute(
+            delete(models.Like)
+            .where(models.Like.user_id == user_id, models.Like.image_id.in_(unlike_ids))
+            .returning(models.Like.image_id)
+        ).scalars())
+
+    liked = set()
+    if like_ids:
+        existing_images = select(literal(user_id), models.Image.id).where(models.Image.id.in_(like_ids))
+        liked = set(db.execute(
+            _dialect_insert(db, models.Like)
+            .from_select(["user_id", "image_id"], existing_images)
+            .on_conflict_do_nothing()
+            .returning(models.Like.image_id)
+        ).scalars())
+
+    deltas = {image_id: 1 for image_id in liked}
+    deltas.update({image_id: -1 for image_id in unliked})
+    if deltas:
+        changed_images = db.execute(
+            update(models.Image)
+            .where(models.Image.id.in_(deltas))
+            .values(like_count=models.Image.like_count + case(deltas, value=models.Image.id, else_=0))
+            .returning(models.Image.id, models.Image.uploaded_by, models.Image.privacy)
+            .execution_options(synchronize_session=False)
+        ).all()
+        # The counts show in owners' galleries (and the feed), is_liked in the liker's views
+        scopes = [user_scope(user_id)]
+        for image_id, owner_id, privacy in changed_images:
+            scopes += image_scopes(owner_id, privacy, image_id)
+        bump_versions(db, scopes)
+    return liked, unliked
 
 @router.post("/images/{image_id}/like")
 def toggle_like(
@@ -251,27 +764,133 @@ def toggle_like(
     current_user: schemas.User = Depends(get_current_user)
 ):
     """Like or unlike an image"""
+    # Remove the like if there is one, otherwise add it
+    _, unliked = apply_likes(db, current_user.id, [], [image_id])
+    if not unliked:
+        liked, _ = apply_likes(db, current_user.id, [image_id], [])
+        # Nothing inserted: the image is gone, or a concurrent request just liked it
+        if not liked and not db.query(models.Image.id).filter(models.Image.id == image_id).first():
+            db.rollback()
+            raise HTTPException(status_code=404, detail="Image not found")
+    db.commit()
+    return {"success": True, "liked": not unliked}
+
+@router.post("/likes/batch")
+def batch_likes(
+    batch: schemas.LikeBatch,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """Apply many like / unlike operations in one transaction; the last operation per image wins"""
+    wanted = {operation.image_id: operation.liked for operation in batch.operations}
+
+    existing = {
+        image_id for (image_id,) in
+        db.query(models.Image.id).filter(models.Image.id.in_(wanted)).all()
+    }
+    missing = sorted(set(wanted) - existing)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Images not found: {missing}")
+
+    liked, unliked = apply_likes(
+        db,
+        current_user.id,
+        [image_id for image_id, like in wanted.items() if like],
+        [image_id for image_id, like in wanted.items() if not like],
+    )
+    db.commit()
+    return {
+        "success": True,
+        "results": [
+            {"image_id": image_id, "liked": like, "changed": image_id in (liked if like else unliked)}
+            for image_id, like in wanted.items()
+        ],
+    }
+
+@router.get("/images/{image_id}/similar", response_model=List[schemas.SimilarImage])
+def get_similar_images(
+    image_id: int,
+    request: Request,
+    response: Response,
+    max_distance: int = Query(settings.SIMILAR_MAX_DISTANCE, ge=0, le=15),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """
+    Public images and your own that look like this one (resized, re-encoded
+    or lightly edited copies), closest first. `distance` is the number of
+    differing bits between the two 64-bit perceptual hashes.
+    """
+    image = db.query(models.Image.uploaded_by, models.Image.privacy, models.Image.perceptual_hash).filter(
+        models.Image.id == image_id
+    ).first()
+    if not image or (image.privacy == "private" and image.uploaded_by != current_user.id):
+        raise HTTPException(status_code=404, detail="Image not found")
+    if image.perceptual_hash is None:
+        raise HTTPException(status_code=409, detail="This image has not been hashed for similarity yet")
+
+    cached = not_modified(
+        request, response, db, [GLOBAL, user_scope(current_user.id)],
+        "similar", current_user.id, image_id
+    )
+    if cached:
+        return cached
+
+    matches = [
+        (match_id, distance)
+        for match_id, distance in similarity_index.query(db, image.perceptual_hash, max_distance)
+        if match_id != image_id
+    ]
+
+    # The index may hold deleted or hidden images; read candidates back in slices until the page is full
+    rows = []
+    for start in range(0, len(matches), limit * 4):
+        distances = dict(matches[start:start + limit * 4])
+        found = db.query(*IMAGE_COLUMNS, *OWNER_COLUMNS).join(
+            models.User, models.Image.uploaded_by == models.User.id
+        ).filter(
+            models.Image.id.in_(distances), visible_to(current_user.id)
+        ).all()
+        rows += sorted(found, key=lambda row: (distances[row.id], -row.id))
+        if len(rows) >= limit:
+            break
+    rows = rows[:limit]
+    distances = dict(matches)
+
+    liked_ids = get_liked_image_ids(db, [row.id for row in rows], current_user.id)
+    results = []
+    for row in rows:
+        similar = serialize_image_row(row, liked_ids)
+        similar["comments"] = []
+        similar["distance"] = distances[row.id]
+        results.append(similar)
+
+    return fast_json_response(results, response)
+
+@router.get("/images/{image_id}/comments", response_model=List[schemas.Comment])
+def get_comments(
+    image_id: int,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    """Get comments on an image, newest first. Pass the X-Next-Cursor header back as `cursor` for older ones"""
     image = db.query(models.Image).filter(models.Image.id == image_id).first()
-    if not image:
+    if not image or (image.privacy == "private" and image.uploaded_by != current_user.id):
         raise HTTPException(status_code=404, detail="Image not found")
     
-    # Check if user already liked this image
-    existing_like = db.query(models.Like).filter(
-        models.Like.user_id == current_user.id,
-        models.Like.image_id == image_id
-    ).first()
-    
-    if existing_like:
-        # Unlike the image
-        db.delete(existing_like)
-        db.commit()
-        return {"success": True, "liked": False}
-    else:
-        # Like the image
-        new_like = models.Like(user_id=current_user.id, image_id=image_id)
-        db.add(new_like)
-        db.commit()
-        return {"success": True, "liked": True}
+    query = db.query(models.Comment).filter(
+        models.Comment.image_id == image_id
+    ).options(
+        joinedload(models.Comment.user)
+    )
+    return paginate(
+        query, response, models.Comment.created_at, models.Comment.id,
+        cursor=cursor, limit=limit
+    )
 
 @router.post("/images/{image_id}/comment", response_model=schemas.Comment)
 def add_comment(
@@ -296,150 +915,17 @@ def add_comment(
     )
     
     db.add(new_comment)
+    db.query(models.Image).filter(models.Image.id == image_id).update(
+        {models.Image.comment_count: models.Image.comment_count + 1},
+        synchronize_session=False
+    )
+    bump_versions(db, image_scopes(image.uploaded_by, image.privacy, image_id))
     db.commit()
     db.refresh(new_comment)
     
-    # Load user information for the response
-    new_comment.user = current_user
+    # current_user is a cached snapshot, not a session object, so it goes straight into the response
+    comment_response = {c.name: getattr(new_comment, c.name) for c in new_comment.__table__.columns}
+    comment_response["user"] = current_user
     
-    return new_comment
-
-# [file name]: images.py
-# Replace the problematic text_to_image code with this:
-
-# [file name]: images.py
-# Add these imports at the top
-from huggingface_hub import InferenceClient
-from io import BytesIO
-import os
-
-@router.post("/generate-ai-image", response_model=schemas.ImageUploadResponse)
-async def generate_ai_image(
-    prompt: str = Form(...),
-    negative_prompt: str = Form(None),
-    title: str = Form(None),
-    caption: str = Form(None),
-    privacy: str = Form("private"),
-    db: Session = Depends(get_db),
-    current_user: schemas.User = Depends(get_current_user)
-):
-    """
-    Generate an AI image using Nebius provider with FLUX.1-dev model
-    """
-    try:
-        print(f"🎨 Starting AI image generation for user {current_user.id}")
-        print(f"📝 Prompt: {prompt}")
-        
-        # Check if token is configured
-        if not hasattr(settings, 'HUGGING_FACE_TOKEN') or not settings.HUGGING_FACE_TOKEN:
-            print("❌ HUGGING_FACE_TOKEN not configured")
-            raise HTTPException(status_code=500, detail="AI service not configured. Please contact administrator.")
-        
-        # Initialize the Inference Client with Nebius provider
-        client = InferenceClient(
-            provider="nebius",
-            api_key=settings.HUGGING_FACE_TOKEN,
-        )
-        
-        print("🌐 Calling Nebius Inference API with FLUX.1-dev...")
-        
-        # Generate the image using FLUX.1-dev model
-        image = client.text_to_image(
-            prompt,
-            model="black-forest-labs/FLUX.1-dev",
-            negative_prompt=negative_prompt
-        )
-        
-        # Convert PIL Image to bytes
-        img_byte_arr = BytesIO()
-        image.save(img_byte_arr, format='PNG')
-        image_data = img_byte_arr.getvalue()
-        
-        # Verify we got an actual image
-        if not image_data or len(image_data) == 0:
-            raise HTTPException(status_code=500, detail="AI service returned empty image")
-        
-        # Get image dimensions from the PIL Image
-        width, height = image.size
-        print(f"📐 Image dimensions: {width}x{height}")
-        
-        # Generate unique filenames
-        file_ext = ".png"
-        original_public_id = f"ai-images/{uuid.uuid4()}{file_ext}"
-        thumbnail_public_id = f"ai-thumbnails/{uuid.uuid4()}"
-        
-        # Create thumbnail using your existing cloudinary_client
-        thumbnail_data = cloudinary_client.generate_thumbnail(image_data)
-        if not thumbnail_data:
-            raise HTTPException(status_code=500, detail="Failed to generate thumbnail")
-        
-        # Upload original to Cloudinary
-        print("☁️ Uploading original to Cloudinary...")
-        original_result = cloudinary_client.upload_image(
-            image_data,
-            original_public_id
-        )
-        
-        if not original_result:
-            raise HTTPException(status_code=500, detail="Failed to upload image to cloud storage")
-        
-        # Upload thumbnail to Cloudinary
-        print("☁️ Uploading thumbnail to Cloudinary...")
-        thumbnail_result = cloudinary_client.upload_image(
-            thumbnail_data,
-            thumbnail_public_id
-        )
-        
-        if not thumbnail_result:
-            # Clean up the original if thumbnail fails
-            cloudinary_client.delete_image(original_public_id)
-            raise HTTPException(status_code=500, detail="Failed to upload thumbnail to cloud storage")
-        
-        # Create database record
-        db_image = models.Image(
-            filename=original_public_id,
-            original_filename=f"ai-generated-{uuid.uuid4()}{file_ext}",
-            file_path=original_result['secure_url'],
-            thumbnail_path=thumbnail_result['secure_url'],
-            mime_type="image/png",
-            file_size=len(image_data),
-            width=width,
-            height=height,
-            title=title or f"AI Generated: {prompt[:50]}...",
-            caption=caption or f"Generated from prompt: {prompt}",
-            alt_text=f"AI generated image based on prompt: {prompt}",
-            privacy=privacy,
-            uploaded_by=current_user.id
-        )
-        
-        db.add(db_image)
-        db.commit()
-        db.refresh(db_image)
-        
-        # Add counts using your existing helper function
-        image_response = add_image_counts(db_image, current_user.id)
-        
-        print("✅ AI image generated and saved successfully!")
-        
-        return {
-            "success": True,
-            "message": "AI image generated and saved to your gallery",
-            "image": image_response
-        }
-        
-    except Exception as e:
-        db.rollback()
-        print(f"❌ Error in AI image generation: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        
-        # Provide specific error messages
-        if "authentication" in str(e).lower() or "token" in str(e).lower():
-            raise HTTPException(status_code=401, detail="AI service authentication failed. Please check your API token.")
-        elif "timeout" in str(e).lower():
-            raise HTTPException(status_code=504, detail="AI generation timed out. Please try again.")
-        elif "model" in str(e).lower() or "flux" in str(e).lower():
-            raise HTTPException(status_code=404, detail="AI model not available. Please try again later.")
-        else:
-            raise HTTPException(status_code=500, detail=f"AI generation failed: {str(e)}")
-# [file content end]
\ No newline at end of file
+    return comment_response
+# [file content end]
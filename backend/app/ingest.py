@@ -0,0 +1,122 @@
+"""
+Bounded-memory upload ingestion.
+
+Uploads are streamed chunk by chunk into a temp file on disk, so a request
+never holds the whole image in memory. Decoding happens from that file in the
+image worker pool, and storage uploads read it back in chunks.
+"""
+import hashlib
+import os
+import tempfile
+from functools import partial
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from .config import settings
+from .workers import io_executor
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _too_large():
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large. Maximum upload size is {settings.MAX_UPLOAD_SIZE // (1024 * 1024)} MB"
+    )
+
+
+def _batch_too_large(max_size):
+    return HTTPException(
+        status_code=413,
+        detail=f"Batch too large. Maximum batch size is {max_size // (1024 * 1024)} MB"
+    )
+
+
+class SpooledUpload:
+    """An upload copied to a temp file, with its size and SHA-256"""
+
+    def __init__(self, path, size, sha256):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def open(self):
+        return open(self.path, "rb")
+
+    def cleanup(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _copy_to_spool(source):
+    size = 0
+    digest = hashlib.sha256()
+    spool = tempfile.NamedTemporaryFile(
+        dir=settings.UPLOAD_SPOOL_DIR or None, prefix="upload-", delete=False
+    )
+    try:
+        with spool:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > settings.MAX_UPLOAD_SIZE:
+                    raise _too_large()
+                digest.update(chunk)
+                spool.write(chunk)
+    except BaseException:
+        os.remove(spool.name)
+        raise
+    return SpooledUpload(spool.name, size, digest.hexdigest())
+
+
+async def spool_upload(file: UploadFile):
+    """Stream an UploadFile into a temp file in fixed-size chunks, hashing as it goes; caller must cleanup()"""
+    await file.seek(0)
+    return await io_executor.run(_copy_to_spool, file.file)
+
+
+class MaxBodySizeMiddleware:
+    """
+    Reject request bodies over MAX_REQUEST_SIZE before they are fully read.
+    The batch upload route gets MAX_BATCH_REQUEST_SIZE instead.
+
+    A declared Content-Length over the limit is refused straight away; for
+    chunked bodies the bytes are counted as they arrive and parsing is
+    aborted as soon as the limit is crossed.
+    """
+
+    def __init__(self, app, max_size=None, path_limits=None):
+        self.app = app
+        self.max_size = max_size or settings.MAX_REQUEST_SIZE
+        if path_limits is None:
+            path_limits = {"/api/upload/batch": settings.MAX_BATCH_REQUEST_SIZE}
+        self.path_limits = path_limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        max_size = self.path_limits.get(scope["path"], self.max_size)
+        too_large = _too_large if max_size == self.max_size else partial(_batch_too_large, max_size)
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_size:
+            error = too_large()
+            response = JSONResponse({"detail": error.detail}, status_code=error.status_code)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_size:
+                    raise too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -1,15 +1,30 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 import os
+import secrets
 
 from . import models, schemas, auth
-from .database import SessionLocal, engine, get_db
+from .migrations import upgrade_schema
+from .search import ensure_search_index
+from .database import SessionLocal, engine, get_db, pool_stats
+from .counters import reconcile_image_counters
+from .workers import worker_stats, shutdown_workers
+from .ingest import MaxBodySizeMiddleware
 
 # Import the images router correctly
 from .images import router as images_router
+from .media import router as media_router
+from .ai_jobs import router as ai_jobs_router, ai_job_runner, prompt_cache_stats
+from .outbox import storage_deletion_worker
+from .similarity import similarity_index
+from .trending import trending_worker
+from .feed_cache import feed_cache
+from .versions import profile_scope, not_modified
+from .config import settings
 
 app = FastAPI(title="Image Gallery API", version="0.1.0")
 
@@ -17,12 +32,26 @@ app = FastAPI(title="Image Gallery API", version="0.1.0")
 
 
 models.Base.metadata.create_all(bind=engine)
+schema_changes = upgrade_schema(engine)
+ensure_search_index(engine)
+
+# Counter columns added to an existing database start at zero, and creating the
+# unique likes index drops duplicate likes, so fill the counters in once
+if {"images.like_count", "images.comment_count", "uq_likes_user_id_image_id"} & set(schema_changes):
+    db = SessionLocal()
+    try:
+        reconcile_image_counters(db)
+    finally:
+        db.close()
 
 
 
 # Get frontend URL from environment variable or use default
 frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
+# Refuse oversized request bodies before they are read (added first so CORS wraps its 413s)
+app.add_middleware(MaxBodySizeMiddleware)
+
 # CORS middleware - UPDATED CONFIGURATION
 app.add_middleware(
     CORSMiddleware,
@@ -37,23 +66,67 @@ app.add_middleware(
 def read_root():
     return {"message": "Image Gallery API"}
 
+@app.get("/metrics")
+def read_metrics(request: Request):
+    # Pool, queue and cache internals are for operators only
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    if not secrets.compare_digest(request.headers.get("Authorization", "").encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return {
+        "workers": worker_stats(),
+        "database": pool_stats(),
+        "user_cache": auth.user_cache.stats(),
+        "ai_jobs": ai_job_runner.stats(),
+        "ai_prompt_cache": prompt_cache_stats(),
+        "storage_deletions": storage_deletion_worker.stats(),
+        "similar_index": similarity_index.stats(),
+        "trending": trending_worker.stats(),
+        "feed_cache": feed_cache.stats(),
+    }
+
+@app.on_event("startup")
+async def startup():
+    ai_job_runner.start()
+    storage_deletion_worker.start()
+    trending_worker.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await ai_job_runner.stop()
+    await storage_deletion_worker.stop()
+    await trending_worker.stop()
+    similarity_index.save()
+    shutdown_workers()
+
 @app.post("/register", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = auth.get_user_by_email(db, email=user.email)
+async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(auth.get_user_by_email, db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return auth.create_user(db=db, user=user)
+    return await auth.create_user(db=db, user=user)
 
 @app.post("/login")
-def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
-    return auth.authenticate_user(db, user.email, user.password)
+async def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
+    return await auth.authenticate_user(db, user.email, user.password)
 
 @app.get("/users/me", response_model=schemas.User)
-def read_users_me(current_user: schemas.User = Depends(auth.get_current_user)):
+def read_users_me(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(auth.get_current_user)
+):
+    cached = not_modified(request, response, db, [profile_scope(current_user.id)], "me", current_user.id)
+    if cached:
+        return cached
     return current_user
 
 # Make sure this line is at the end and uses the correct router variable
 app.include_router(images_router, prefix="/api", tags=["images"])
+app.include_router(ai_jobs_router, prefix="/api", tags=["ai"])
+app.include_router(media_router, tags=["media"])
 
 if os.getenv("RAILWAY_ENVIRONMENT") or os.getenv("PRODUCTION"):
     from fastapi.staticfiles import StaticFiles
@@ -0,0 +1,132 @@
+"""
+Serves files from the local storage backend.
+
+URLs are content addressed (/media/<sha256>.<ext>), so responses are
+immutable: the digest is a strong ETag and browsers may cache forever.
+Single byte ranges are supported for resumable / partial downloads.
+
+The body is sent with the ASGI zero-copy sendfile extension when the server
+offers it. Behind nginx, set LOCAL_STORAGE_ACCEL_REDIRECT to hand the file
+to nginx's sendfile via X-Accel-Redirect instead.
+"""
+import mimetypes
+import os
+import re
+import anyio
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+from .config import settings
+from .storage import storage, LocalStorage
+
+router = APIRouter()
+
+CHUNK_SIZE = 256 * 1024
+_DIGEST = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]+)?$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header, size):
+    """Return (start, end) for a single satisfiable byte range, or None to send the whole file"""
+    match = _RANGE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+class StoredFileResponse(Response):
+    """Streams part or all of a file, preferring zero-copy sendfile"""
+
+    def __init__(self, path, start, length, status_code, headers, media_type):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.length = length
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if scope["method"] == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.wrapped.fileno(),
+                    "offset": self.start,
+                    "count": self.length,
+                })
+                return
+
+            await f.seek(self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+
+@router.api_route("/media/{name}", methods=["GET", "HEAD"])
+def serve_media(name: str, request: Request):
+    """Serve a stored file by its content digest"""
+    match = _DIGEST.match(name)
+    if not isinstance(storage, LocalStorage) or not match:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    digest, ext = match.groups()
+    path = storage.blob_path(digest)
+    try:
+        size = os.stat(path).st_size
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    media_type = mimetypes.guess_type(f"file{ext or ''}")[0] or "application/octet-stream"
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    # If-Range with a stale validator means "send the whole file"
+    if range_header and request.headers.get("if-range", etag) == etag:
+        byte_range = _parse_range(range_header, size)
+
+    if settings.LOCAL_STORAGE_ACCEL_REDIRECT:
+        # nginx serves the file (and any Range) itself with sendfile
+        headers["X-Accel-Redirect"] = (
+            f"{settings.LOCAL_STORAGE_ACCEL_REDIRECT.rstrip('/')}/blobs/{digest[:2]}/{digest[2:4]}/{digest}"
+        )
+        return Response(headers=headers, media_type=media_type)
+
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return StoredFileResponse(path, start, end - start + 1, 206, headers, media_type)
+    return StoredFileResponse(path, 0, size, 200, headers, media_type)
@@ -0,0 +1,62 @@
+from sqlalchemy import inspect, text
+from .database import Base
+
+
+def upgrade_schema(engine):
+    """
+    Bring an existing database up to date with the models.
+
+    create_all only creates missing tables, so columns and indexes added to
+    tables that already exist have to be created here. Returns the names of
+    the columns that were added, as "table.column", followed by the names of
+    the indexes that were created.
+
+    Before a unique index is created on an existing table, duplicate rows
+    are removed, keeping the oldest (lowest id) of each group.
+    """
+    added_columns = []
+    added_indexes = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    default = default.text if hasattr(default, "text") else f"'{default}'"
+                    ddl += f" DEFAULT {default}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                conn.execute(text(ddl))
+                added_columns.append(f"{table.name}.{column.name}")
+                print(f"🛠️ Added column {table.name}.{column.name}")
+
+            existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    if index.unique:
+                        _remove_duplicates(conn, table, index)
+                    index.create(bind=conn)
+                    added_indexes.append(index.name)
+                    print(f"🛠️ Created index {index.name}")
+
+    return added_columns + added_indexes
+
+
+def _remove_duplicates(conn, table, index):
+    columns = ", ".join(column.name for column in index.columns)
+    result = conn.execute(text(
+        f"DELETE FROM {table.name} WHERE id NOT IN "
+        f"(SELECT MIN(id) FROM {table.name} GROUP BY {columns})"
+    ))
+    if result.rowcount:
+        print(f"🛠️ Removed {result.rowcount} duplicate rows from {table.name} for {index.name}")
@@ -1,10 +1,18 @@
 # [file name]: models.py
 # [file content begin]
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON, Index, Float, BigInteger
 from sqlalchemy.sql import func
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import relationship
 from .database import Base
 
+# SQLite's CURRENT_TIMESTAMP has no fractional seconds; bind datetimes in the
+# same text format so range comparisons (keyset cursors) line up with stored rows
+SQLITE_TIMESTAMP = sqlite.DATETIME(
+    storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+)
+Timestamp = DateTime(timezone=True).with_variant(SQLITE_TIMESTAMP, "sqlite")
+
 class User(Base):
     __tablename__ = "users"
 
@@ -30,6 +38,7 @@ class Image(Base):
     original_filename = Column(String)
     file_path = Column(String)  # This will store the S3 URL
     thumbnail_path = Column(String)  # This will store the S3 URL
+    thumbnail_public_id = Column(String, nullable=True)
     mime_type = Column(String)
     file_size = Column(Integer)
     width = Column(Integer)
@@ -38,37 +47,138 @@ class Image(Base):
     caption = Column(Text, nullable=True)  # Fixed: Text is now imported
     alt_text = Column(String, nullable=True)
     exif_data = Column(JSON, nullable=True)
+    # Facets promoted from exif_data so filters and counts use indexes instead of JSON
+    camera_make = Column(String, nullable=True)
+    camera_model = Column(String, nullable=True)
+    taken_at = Column(Timestamp, nullable=True)  # Camera local time, as recorded
+    focal_length = Column(Float, nullable=True)
+    gps_latitude = Column(Float, nullable=True)
+    gps_longitude = Column(Float, nullable=True)
+    # Resized copies for srcset: [{width, height, format, url, public_id}, ...]
+    derivatives = Column(JSON, nullable=True)
+    # SHA-256 of the original bytes; duplicate uploads share the stored files
+    content_hash = Column(String(64), index=True, nullable=True)
+    # 64-bit dHash for "similar images" (see similarity.py); signed to fit a BIGINT
+    perceptual_hash = Column(BigInteger, nullable=True)
     privacy = Column(String, default="public")  # public, unlisted, private
     uploaded_by = Column(Integer, ForeignKey("users.id"))
-    uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
+    uploaded_at = Column(Timestamp, server_default=func.now())
+    # Denormalized counters, kept in step by toggle_like/add_comment (see counters.py)
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationships
     owner = relationship("User", back_populates="images")
     likes = relationship("Like", back_populates="image", cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="image", cascade="all, delete-orphan")
 
+    # Composite indexes backing keyset pagination of the feed and user galleries
+    __table_args__ = (
+        Index("ix_images_privacy_uploaded_at_id", "privacy", "uploaded_at", "id"),
+        Index("ix_images_uploaded_by_uploaded_at_id", "uploaded_by", "uploaded_at", "id"),
+        # EXIF facet filters and counts over public images (the owner's own images come from uploaded_by)
+        Index("ix_images_privacy_camera_make", "privacy", "camera_make"),
+        Index("ix_images_privacy_camera_model", "privacy", "camera_model"),
+        Index("ix_images_privacy_taken_at", "privacy", "taken_at"),
+        Index("ix_images_uploaded_by_gps_latitude", "uploaded_by", "gps_latitude"),
+    )
+
 class Like(Base):
     __tablename__ = "likes"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    image_id = Column(Integer, ForeignKey("images.id"))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    image_id = Column(Integer, ForeignKey("images.id"), index=True)
+    created_at = Column(Timestamp, server_default=func.now())
     
     # Relationships
     user = relationship("User", back_populates="likes")
     image = relationship("Image", back_populates="likes")
 
+    # One like per user per image; also the conflict target for the like upsert
+    __table_args__ = (
+        Index("uq_likes_user_id_image_id", "user_id", "image_id", unique=True),
+    )
+
 class Comment(Base):
     __tablename__ = "comments"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    image_id = Column(Integer, ForeignKey("images.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    image_id = Column(Integer, ForeignKey("images.id"), index=True)
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
     
     # Relationships
     user = relationship("User", back_populates="comments")
     image = relationship("Image", back_populates="comments")
+
+    # Backs the newest-first comment listing and the feed's per-image preview
+    __table_args__ = (
+        Index("ix_comments_image_id_created_at_id", "image_id", "created_at", "id"),
+    )
+
+class AIJob(Base):
+    __tablename__ = "ai_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(String, nullable=False, default="queued", server_default="queued")  # queued, running, succeeded, failed
+    model = Column(String)
+    prompt = Column(Text, nullable=False)
+    negative_prompt = Column(Text)
+    seed = Column(Integer)
+    title = Column(String)
+    caption = Column(Text)
+    privacy = Column(String, default="private")
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="SET NULL"))
+    error = Column(Text)
+    created_at = Column(Timestamp, server_default=func.now())
+    started_at = Column(Timestamp)
+    finished_at = Column(Timestamp)
+
+    # Workers claim the oldest queued job
+    __table_args__ = (
+        Index("ix_ai_jobs_status_id", "status", "id"),
+    )
+
+class CacheVersion(Base):
+    """Change counters behind the ETags of list endpoints (see versions.py)"""
+    __tablename__ = "cache_versions"
+
+    scope = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
+class TrendingScore(Base):
+    """A public image's decayed engagement score for the trending feed (see trending.py)"""
+    __tablename__ = "trending_scores"
+
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False)
+    updated_at = Column(Timestamp, server_default=func.now())
+
+    # Ranked pages of the trending feed
+    __table_args__ = (
+        Index("ix_trending_scores_score_image_id", "score", "image_id"),
+    )
+
+class TrendingCheckpoint(Base):
+    """The last row of a source table (images, likes, comments) folded into trending_scores"""
+    __tablename__ = "trending_checkpoints"
+
+    source = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0, server_default="0")
+
+class StorageDeletion(Base):
+    """A stored file waiting to be deleted from storage (see outbox.py)"""
+    __tablename__ = "storage_deletions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    public_id = Column(String, nullable=False)
+    # The original the file was stored with; images sharing that original share all its files
+    filename = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at = Column(Timestamp, server_default=func.now(), index=True)
+    last_error = Column(Text)
+    created_at = Column(Timestamp, server_default=func.now())
 # [file content end]
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""
+Durable queue of storage deletions.
+
+Deleting an image only records its stored files in storage_deletions, in
+the same transaction that removes the row, so the request never waits on
+remote deletes and a crash can't lose one. A background worker drains due
+rows in batches through storage.delete_images; failures are retried with
+exponential backoff up to STORAGE_DELETE_MAX_ATTEMPTS times, after which the
+row is left in the table (with its last_error) for inspection. Before
+deleting, the worker drops rows whose original an image uses again.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update, delete, insert
+from sqlalchemy.orm import Session
+from . import models
+from .config import settings
+from .database import SessionLocal
+from .storage import storage
+from .workers import io_executor
+
+# How long a claimed batch is hidden from other workers while it is deleted
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def queue_storage_deletions(db: Session, files):
+    """Queue stored files, as (original filename, public_id) pairs, for deletion; the caller commits"""
+    if files:
+        db.execute(
+            insert(models.StorageDeletion),
+            [{"filename": filename, "public_id": public_id} for filename, public_id in files]
+        )
+
+
+def claim_due_deletions(db: Session, limit):
+    """Lease up to `limit` due deletions to this worker and return [(id, public_id, attempts)]"""
+    now = datetime.now(timezone.utc)
+    Deletion = models.StorageDeletion
+    due = (Deletion.next_attempt_at <= now, Deletion.attempts < settings.STORAGE_DELETE_MAX_ATTEMPTS)
+    batch = select(Deletion.id).where(*due).order_by(Deletion.id).limit(limit).scalar_subquery()
+
+    rows = db.execute(
+        update(Deletion)
+        .where(Deletion.id.in_(batch), *due)
+        .values(next_attempt_at=now + CLAIM_LEASE, attempts=Deletion.attempts + 1)
+        .returning(Deletion.id, Deletion.public_id, Deletion.filename, Deletion.attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return rows
+
+
+def drop_referenced_deletions(db: Session, rows):
+    """
+    Drop claimed deletions whose files an image references again and return
+    the rest. A duplicate upload can find a row just before it is deleted
+    and reuse its files after the delete has queued them.
+    """
+    Image = models.Image
+    keys = {row.filename or row.public_id for row in rows}
+    referenced = set(db.scalars(select(Image.filename).where(Image.filename.in_(keys))))
+    # Rows queued before the original was recorded can only be matched file by file
+    unowned = [row.public_id for row in rows if row.filename is None]
+    if unowned:
+        referenced.update(db.scalars(select(Image.thumbnail_public_id).where(Image.thumbnail_public_id.in_(unowned))))
+
+    in_use = [row for row in rows if (row.filename or row.public_id) in referenced or row.public_id in referenced]
+    if not in_use:
+        return rows
+    db.execute(delete(models.StorageDeletion).where(models.StorageDeletion.id.in_([row.id for row in in_use])))
+    db.commit()
+    print(f"♻️ Kept {len(in_use)} queued files an image uses again")
+    in_use_ids = {row.id for row in in_use}
+    return [row for row in rows if row.id not in in_use_ids]
+
+
+class StorageDeletionWorker:
+    """Background task that deletes queued files from storage"""
+
+    def __init__(self, batch_size, poll_interval, retry_delay):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self._task = None
+        self._wake = None
+        self._deleted = 0
+        self._failed = 0
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._work())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self):
+        """Drain new deletions now instead of at the next poll"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _work(self):
+        while True:
+            self._wake.clear()
+            try:
+                drained = await self.drain_batch()
+            except Exception as e:
+                print(f"❌ Error draining storage deletions: {e}")
+                drained = 0
+
+            # A full batch means there is probably more waiting
+            if drained < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain_batch(self):
+        """Delete one batch of due files; returns how many were claimed"""
+        # The database work runs in the io executor too, so the event loop never
+        # waits on a pool checkout or SQLite's write lock
+        claimed, rows = await io_executor.run(self._claim)
+        if not rows:
+            return claimed
+
+        error = None
+        try:
+            gone = set(await io_executor.run(storage.delete_images, [row.public_id for row in rows]))
+        except Exception as e:
+            error = str(e)
+            gone = set()
+
+        done = await io_executor.run(self._record, rows, gone, error)
+        self._deleted += done
+        self._failed += len(rows) - done
+        if done:
+            print(f"🗑️ Deleted {done} stored files")
+        if done < len(rows):
+            print(f"⚠️ Warning: {len(rows) - done} stored files not deleted, will retry")
+        return claimed
+
+    def _claim(self):
+        db = SessionLocal()
+        try:
+            rows = claim_due_deletions(db, self.batch_size)
+            return len(rows), drop_referenced_deletions(db, rows) if rows else rows
+        finally:
+            db.close()
+
+    def _record(self, rows, gone, error):
+        """Drop the rows whose files are gone and back off the rest; returns how many were dropped"""
+        db = SessionLocal()
+        try:
+            done = [row.id for row in rows if row.public_id in gone]
+            if done:
+                db.execute(delete(models.StorageDeletion).where(models.StorageDeletion.id.in_(done)))
+
+            now = datetime.now(timezone.utc)
+            for row in rows:
+                if row.public_id in gone:
+                    continue
+                db.execute(
+                    update(models.StorageDeletion)
+                    .where(models.StorageDeletion.id == row.id)
+                    .values(
+                        next_attempt_at=now + timedelta(seconds=self.retry_delay * 2 ** (row.attempts - 1)),
+                        last_error=error or "Storage did not confirm the deletion"
+                    )
+                )
+            db.commit()
+            return len(done)
+        finally:
+            db.close()
+
+    def stats(self):
+        return {"deleted": self._deleted, "failed_attempts": self._failed}
+
+
+storage_deletion_worker = StorageDeletionWorker(
+    batch_size=settings.STORAGE_DELETE_BATCH_SIZE,
+    poll_interval=settings.STORAGE_DELETE_POLL_INTERVAL,
+    retry_delay=settings.STORAGE_DELETE_RETRY_DELAY,
+)
@@ -0,0 +1,99 @@
+import base64
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import literal, tuple_
+from . import models
+
+# Response header carrying the cursor for the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(timestamp, row_id):
+    """Build an opaque cursor pointing at the given (timestamp, id) key"""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Turn an opaque cursor back into a (timestamp, id) key"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(query, response, timestamp_column, id_column, cursor=None, skip=0, limit=100):
+    """
+    Return one page of rows ordered newest first by (timestamp_column, id_column).
+
+    With a cursor the page starts right after the cursor key, so the database
+    seeks into a composite index instead of walking past `skip` rows.
+    `skip` is only kept for older clients and gets slower on deep pages.
+    The cursor for the following page is sent in the X-Next-Cursor header.
+    """
+    query = query.order_by(timestamp_column.desc(), id_column.desc())
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.filter(
+            tuple_(timestamp_column, id_column)
+            < tuple_(literal(timestamp, timestamp_column.type), row_id)
+        )
+    elif skip:
+        query = query.offset(skip)
+
+    rows = query.limit(limit).all()
+
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            getattr(last, timestamp_column.key), getattr(last, id_column.key)
+        )
+    return rows
+
+
+def paginate_images(query, response, cursor=None, skip=0, limit=100):
+    """Page through images newest first by (uploaded_at, id)"""
+    return paginate(
+        query, response, models.Image.uploaded_at, models.Image.id,
+        cursor=cursor, skip=skip, limit=limit
+    )
+
+
+def encode_rank_cursor(score, row_id):
+    """Build an opaque cursor pointing at the given (relevance score, id) key"""
+    raw = f"{score!r}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_rank_cursor(cursor):
+    """Turn an opaque ranked-results cursor back into a (score, id) key"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, row_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return float(score), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate_ranked(query, response, score_column, id_column, cursor=None, limit=100):
+    """
+    Return one page of rows ordered best first by (score_column, id_column),
+    continuing after a cursor from encode_rank_cursor. Scores are compared
+    exactly as stored, so the cursor for the following page (sent in the
+    X-Next-Cursor header) carries the last score verbatim.
+    """
+    query = query.order_by(score_column.desc(), id_column.desc())
+    if cursor:
+        score, row_id = decode_rank_cursor(cursor)
+        query = query.filter(tuple_(score_column, id_column) < tuple_(literal(score), row_id))
+
+    rows = query.limit(limit).all()
+
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_rank_cursor(
+            getattr(last, score_column.key), getattr(last, id_column.key)
+        )
+    return rows
@@ -2,7 +2,7 @@
 # [file content begin]
 from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Union
 
 class UserBase(BaseModel):
     email: EmailStr
@@ -24,6 +24,13 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class UserSummary(BaseModel):
+    id: int
+    full_name: str
+
+    class Config:
+        from_attributes = True
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -39,6 +46,12 @@ class ImageCreate(ImageBase):
     mime_type: str
     file_size: int
 
+class ImageDerivative(BaseModel):
+    width: int
+    height: int
+    format: str
+    url: str
+
 class Image(ImageBase):
     id: int
     filename: str
@@ -51,15 +64,44 @@ class Image(ImageBase):
     like_count: int = 0
     is_liked: bool = False
     comment_count: int = 0
+    derivatives: Optional[List[ImageDerivative]] = None
+    # From the original's EXIF metadata, when it had any
+    camera_make: Optional[str] = None
+    camera_model: Optional[str] = None
+    taken_at: Optional[datetime] = None
+    focal_length: Optional[float] = None
 
     class Config:
         from_attributes = True
 
+class FacetCount(BaseModel):
+    value: Union[str, int]
+    count: int
+
+class ImageFacets(BaseModel):
+    camera_make: List[FacetCount]
+    camera_model: List[FacetCount]
+    taken_year: List[FacetCount]
+
 class ImageUploadResponse(BaseModel):
     success: bool
     message: str
     image: Optional[Image] = None
 
+class BatchUploadResult(BaseModel):
+    filename: Optional[str] = None
+    success: bool
+    error: Optional[str] = None
+    image: Optional[Image] = None
+
+class BatchUploadResponse(BaseModel):
+    success: bool
+    message: str
+    results: List[BatchUploadResult]
+
+class BulkDeleteRequest(BaseModel):
+    image_ids: List[int] = Field(..., min_length=1, max_length=1000)
+
 class LikeBase(BaseModel):
     image_id: int
 
@@ -74,6 +116,12 @@ class Like(LikeBase):
     class Config:
         from_attributes = True
 
+class LikeOperation(LikeBase):
+    liked: bool
+
+class LikeBatch(BaseModel):
+    operations: List[LikeOperation] = Field(..., min_length=1, max_length=100)
+
 class CommentBase(BaseModel):
     content: str = Field(..., min_length=1, max_length=500)
     image_id: int
@@ -85,18 +133,23 @@ class Comment(CommentBase):
     id: int
     user_id: int
     created_at: datetime
-    user: User
+    user: UserSummary
 
     class Config:
         from_attributes = True
 
 class PublicImage(Image):
     owner: User
+    # Only the latest few comments; the rest come from /images/{id}/comments
     comments: List[Comment] = []
 
     class Config:
         from_attributes = True
 
+class SimilarImage(PublicImage):
+    # Bits differing between the two perceptual hashes
+    distance: int
+
 
 class AIImageGenerate(BaseModel):
     prompt: str = Field(..., min_length=1, max_length=1000)
@@ -104,4 +157,27 @@ class AIImageGenerate(BaseModel):
     title: Optional[str] = Field(None, max_length=100)
     caption: Optional[str] = Field(None, max_length=500)
     privacy: str = "private"
+
+class AIJob(BaseModel):
+    id: int
+    status: str
+    model: Optional[str] = None
+    prompt: str
+    negative_prompt: Optional[str] = None
+    seed: Optional[int] = None
+    image_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # Filled in once the job has succeeded
+    image: Optional[Image] = None
+
+    class Config:
+        from_attributes = True
+
+class AIJobResponse(BaseModel):
+    success: bool
+    message: str
+    job: AIJob
 # [file content end]
\ No newline at end of file
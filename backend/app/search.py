@@ -0,0 +1,202 @@
+"""
+Full-text search over image titles, captions and alt text.
+
+The inverted index lives in the database and is kept in sync on every write:
+
+    SQLite      an external-content FTS5 table, images_fts, maintained by
+                triggers on images
+    PostgreSQL  a generated tsvector column, images.search_vector, with a
+                GIN index
+
+Neither is part of the models, so ensure_search_index creates them at
+startup (and fills the index from existing rows the first time). Titles
+weigh more than captions, and captions more than alt text. Every search
+term is matched as a prefix, so "sun" finds "sunset".
+
+Searches can also be narrowed, or made without a keyword at all, by the EXIF
+facet columns (camera, date taken, location), which have their own indexes.
+"""
+import re
+from sqlalchemy import func, inspect, literal_column, table, column, text, select, union_all
+from sqlalchemy.orm import Session
+from . import models
+from .pagination import paginate_images, paginate_ranked
+
+# Terms beyond this are ignored, keeping queries cheap
+MAX_SEARCH_TERMS = 8
+
+# bm25 weights for title, caption, alt_text (SQLite); PostgreSQL uses tsvector weights A, B, C
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+SQLITE_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE images_fts USING fts5("
+    "title, caption, alt_text, content='images', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS images_fts_insert AFTER INSERT ON images BEGIN "
+    "INSERT INTO images_fts(rowid, title, caption, alt_text) "
+    "VALUES (new.id, new.title, new.caption, new.alt_text); END",
+    "CREATE TRIGGER IF NOT EXISTS images_fts_delete AFTER DELETE ON images BEGIN "
+    "INSERT INTO images_fts(images_fts, rowid, title, caption, alt_text) "
+    "VALUES ('delete', old.id, old.title, old.caption, old.alt_text); END",
+    # Counter updates don't touch the text, so they don't touch the index either
+    "CREATE TRIGGER IF NOT EXISTS images_fts_update AFTER UPDATE OF title, caption, alt_text ON images BEGIN "
+    "INSERT INTO images_fts(images_fts, rowid, title, caption, alt_text) "
+    "VALUES ('delete', old.id, old.title, old.caption, old.alt_text); "
+    "INSERT INTO images_fts(rowid, title, caption, alt_text) "
+    "VALUES (new.id, new.title, new.caption, new.alt_text); END",
+    "INSERT INTO images_fts(images_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_INDEX_DDL = [
+    "ALTER TABLE images ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(caption, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(alt_text, '')), 'C')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_images_search_vector ON images USING GIN (search_vector)",
+]
+
+images_fts = table("images_fts", column("rowid"))
+
+
+def ensure_search_index(engine):
+    """Create the search index if it doesn't exist yet; returns True when it was created"""
+    inspector = inspect(engine)
+    if engine.dialect.name == "postgresql":
+        if "search_vector" in {c["name"] for c in inspector.get_columns("images")}:
+            return False
+        statements = POSTGRES_INDEX_DDL
+    else:
+        if "images_fts" in inspector.get_table_names():
+            return False
+        statements = SQLITE_INDEX_DDL
+
+    # Generating or rebuilding the index reads every existing image once
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+    print("🛠️ Created the image search index")
+    return True
+
+
+def search_terms(keyword):
+    """The words of a search, lowercased; punctuation and query syntax are dropped"""
+    return re.findall(r"\w+", keyword.lower())[:MAX_SEARCH_TERMS]
+
+
+def ranked_matches(db: Session, terms):
+    """
+    A subquery of (id, score) for every image matching all terms, where a
+    higher score is a better match.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        search_vector = literal_column("images.search_vector")
+        query = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+        return db.query(
+            models.Image.id.label("id"),
+            func.ts_rank(search_vector, query).label("score")
+        ).filter(search_vector.op("@@")(query)).subquery()
+
+    match = " AND ".join(f'"{term}"*' for term in terms)
+    # bm25 is lower for better matches
+    return db.query(
+        images_fts.c.rowid.label("id"),
+        (-func.bm25(literal_column("images_fts"), *FTS_WEIGHTS)).label("score")
+    ).select_from(images_fts).filter(
+        literal_column("images_fts").op("MATCH")(match)
+    ).subquery()
+
+
+def visible_to(viewer_id):
+    """Images viewer_id may find: public ones and their own"""
+    return (models.Image.privacy == "public") | (models.Image.uploaded_by == viewer_id)
+
+
+def facet_filters(viewer_id, camera_make=None, camera_model=None, taken_after=None, taken_before=None, bbox=None):
+    """
+    Conditions for the EXIF facet filters, each served by an index. bbox is
+    (min_lat, max_lat, min_lon, max_lon); a min_lon above max_lon wraps
+    around the antimeridian. Location filters only ever match the viewer's
+    own images, so nobody can probe where other people's photos were taken.
+    """
+    filters = []
+    if camera_make:
+        filters.append(models.Image.camera_make == camera_make)
+    if camera_model:
+        filters.append(models.Image.camera_model == camera_model)
+    if taken_after:
+        filters.append(models.Image.taken_at >= taken_after)
+    if taken_before:
+        filters.append(models.Image.taken_at < taken_before)
+    if bbox:
+        min_lat, max_lat, min_lon, max_lon = bbox
+        filters.append(models.Image.uploaded_by == viewer_id)
+        filters.append(models.Image.gps_latitude.between(min_lat, max_lat))
+        if min_lon <= max_lon:
+            filters.append(models.Image.gps_longitude.between(min_lon, max_lon))
+        else:
+            filters.append((models.Image.gps_longitude >= min_lon) | (models.Image.gps_longitude <= max_lon))
+    return filters
+
+
+def search_images(db: Session, response, keyword, viewer_id, columns, filters=(), cursor=None, limit=20):
+    """
+    One page of images viewer_id may see that match keyword and filters.
+
+    With a keyword, best matches come first (ties newest id first) and each
+    row of `columns` is followed by its score. Without one, the filtered
+    images come newest first like the gallery. Either way the cursor for the
+    next page is sent in the X-Next-Cursor header.
+    """
+    query = db.query(*columns).join(
+        models.User, models.Image.uploaded_by == models.User.id
+    ).filter(visible_to(viewer_id), *filters)
+
+    if not keyword:
+        return paginate_images(query, response, cursor=cursor, limit=limit)
+
+    terms = search_terms(keyword)
+    if not terms:
+        return []
+
+    matches = ranked_matches(db, terms)
+    query = query.add_columns(matches.c.score).join(matches, matches.c.id == models.Image.id)
+    return paginate_ranked(query, response, matches.c.score, models.Image.id, cursor=cursor, limit=limit)
+
+
+def facet_counts(db: Session, viewer_id, limit=50):
+    """
+    How many images viewer_id may see per camera make, camera model and year
+    taken, most common first.
+
+    Public images are counted from the (privacy, facet) indexes and the
+    viewer's other images through uploaded_by, then the two are added up,
+    so no count reads image rows or exif_data.
+    """
+    Image = models.Image
+    facets = {
+        "camera_make": lambda: Image.camera_make,
+        "camera_model": lambda: Image.camera_model,
+        "taken_year": lambda: func.extract("year", Image.taken_at),
+    }
+    counts = {}
+    for name, facet in facets.items():
+        parts = [
+            select(facet().label("value"), func.count().label("count"))
+            .where(facet().isnot(None), *visibility)
+            .group_by(facet())
+            for visibility in (
+                [Image.privacy == "public"],
+                [Image.uploaded_by == viewer_id, Image.privacy != "public"],
+            )
+        ]
+        both = union_all(*parts).subquery()
+        total = func.sum(both.c.count)
+        rows = db.execute(
+            select(both.c.value, total).group_by(both.c.value)
+            .order_by(total.desc(), both.c.value).limit(limit)
+        ).all()
+        counts[name] = [
+            {"value": int(value) if name == "taken_year" else value, "count": int(count)}
+            for value, count in rows
+        ]
+    return counts
@@ -0,0 +1,91 @@
+"""
+Lean serialization for image list endpoints.
+
+List pages are read as plain column tuples, turned into dicts holding
+exactly the fields of schemas.Image / schemas.PublicImage, and written out
+with orjson when it is installed. The rows come straight from our own
+database, so the per-item response_model validation is skipped; the
+response_model stays on the routes for the OpenAPI docs.
+"""
+import json
+from datetime import date, datetime
+from fastapi import Response
+from . import models, schemas
+
+try:
+    import orjson
+except ImportError:  # Fall back to the (slower) standard library encoder
+    orjson = None
+
+# Columns fetched for list pages: only what the response schemas expose
+IMAGE_FIELDS = [name for name in schemas.Image.model_fields if name in models.Image.__table__.c]
+IMAGE_COLUMNS = [models.Image.__table__.c[name] for name in IMAGE_FIELDS]
+OWNER_FIELDS = list(schemas.User.model_fields)
+OWNER_COLUMNS = [models.User.__table__.c[name].label(f"owner_{name}") for name in OWNER_FIELDS]
+DERIVATIVE_FIELDS = list(schemas.ImageDerivative.model_fields)
+COMMENT_FIELDS = [name for name in schemas.Comment.model_fields if name != "user"]
+COMMENT_USER_FIELDS = list(schemas.UserSummary.model_fields)
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content):
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+def fast_json_response(content, response: Response):
+    """
+    Send already shaped content as JSON. Headers set on the endpoint's injected
+    response (cursor, ETag, ...) are carried over, as FastAPI only merges them
+    into responses it builds itself.
+    """
+    fast = FastJSONResponse(content)
+    fast.raw_headers.extend(
+        (key, value) for key, value in response.raw_headers
+        if key not in (b"content-length", b"content-type")
+    )
+    return fast
+
+
+def serialize_image_row(row, liked_ids):
+    """
+    A row of IMAGE_COLUMNS (optionally followed by OWNER_COLUMNS) as a
+    schemas.Image dict; any further columns, such as a search score, are ignored
+    """
+    image = dict(zip(IMAGE_FIELDS, row))
+    if image["derivatives"]:
+        # Stored records also carry the storage public_id, which isn't part of the API
+        image["derivatives"] = [
+            {field: derivative[field] for field in DERIVATIVE_FIELDS}
+            for derivative in image["derivatives"]
+        ]
+    image["is_liked"] = image["id"] in liked_ids
+    if len(row) > len(IMAGE_FIELDS):
+        image["owner"] = dict(zip(OWNER_FIELDS, row[len(IMAGE_FIELDS):]))
+    return image
+
+
+def serialize_comment(comment):
+    """A Comment with its user loaded, as a schemas.Comment dict"""
+    serialized = {field: getattr(comment, field) for field in COMMENT_FIELDS}
+    serialized["user"] = {field: getattr(comment.user, field) for field in COMMENT_USER_FIELDS}
+    return serialized
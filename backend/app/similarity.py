@@ -0,0 +1,302 @@
+"""
+"Similar images" lookup over perceptual hashes.
+
+Every image gets a 64-bit dHash at ingest (images.perceptual_hash). Finding
+images within a Hamming distance of one of them uses an in-memory
+multi-index hash table per process:
+
+  * each hash is split into four 16-bit chunks, each with its own table of
+    chunk value -> positions;
+  * two hashes at most `d` bits apart agree to within d // 4 bits on at
+    least one chunk, so a query probes only the chunk values that close to
+    its own, and checks the full distance of the candidates found there.
+
+The index is loaded on the first query: from the snapshot at
+SIMILAR_INDEX_PATH (two flat arrays of ids and hashes) when there is one,
+otherwise from the database. Before every query it picks up images added
+since (by id), so it is updated incrementally without hooks on the write
+paths. Ids are taken at insert but seen at commit, so a smaller id can
+show up after a larger one: images uploaded in the last
+SIMILAR_SETTLE_TIME seconds are looked for again on every catch-up, and
+only older ones move the id checkpoint on. Deleted or hidden images are
+filtered out when the results are read back from the database. The
+snapshot is written after a full load and at shutdown.
+
+Images from before perceptual hashes were stored are hashed from their
+thumbnails by running, from the backend directory:
+
+    python -m app.similarity [batch_size]
+
+Running processes pick up those hashes on their next restart.
+"""
+import os
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import combinations
+import requests
+from sqlalchemy.orm import Session
+from . import models
+from .config import settings
+from .database import SessionLocal
+from .image_processing import perceptual_hash_bytes
+
+HASH_BITS = 64
+CHUNK_BITS = 16
+CHUNKS = HASH_BITS // CHUNK_BITS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+HASH_MASK = (1 << HASH_BITS) - 1
+
+SNAPSHOT_MAGIC = b"PHIDX001"
+DEFAULT_BATCH_SIZE = 500
+
+
+def _flip_masks(max_bits):
+    """Every CHUNK_BITS-bit mask with at most max_bits bits set"""
+    masks = []
+    for bits in range(max_bits + 1):
+        for positions in combinations(range(CHUNK_BITS), bits):
+            mask = 0
+            for position in positions:
+                mask |= 1 << position
+            masks.append(mask)
+    return masks
+
+
+class SimilarityIndex:
+    """Multi-index Hamming search over the perceptual hashes of all images"""
+
+    def __init__(self, snapshot_path):
+        self.snapshot_path = snapshot_path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._ids = array("q")
+        self._hashes = array("Q")
+        self._tables = [{} for _ in range(CHUNKS)]
+        self._max_id = 0  # Every image up to this id has been seen
+        self._recent = set()  # Ids above _max_id already seen
+        self._snapshot_mtime = None
+        self._masks = {}
+        self._queries = 0
+        self._query_time = 0.0
+
+    def _add(self, image_id, phash):
+        phash &= HASH_MASK
+        position = len(self._ids)
+        self._ids.append(image_id)
+        self._hashes.append(phash)
+        for chunk, table in enumerate(self._tables):
+            value = (phash >> (chunk * CHUNK_BITS)) & CHUNK_MASK
+            positions = table.get(value)
+            if positions is None:
+                positions = table[value] = array("I")
+            positions.append(position)
+
+    def _catch_up(self, db: Session, batch_size=50000):
+        """Add images created since the last load; returns how many were new"""
+        settled_before = datetime.now(timezone.utc) - timedelta(seconds=settings.SIMILAR_SETTLE_TIME)
+        settled = True
+        last_id = self._max_id
+        seen = 0
+        while True:
+            rows = db.query(models.Image.id, models.Image.perceptual_hash, models.Image.uploaded_at).filter(
+                models.Image.id > last_id
+            ).order_by(models.Image.id).limit(batch_size).all()
+            for image_id, phash, uploaded_at in rows:
+                if image_id not in self._recent:
+                    self._recent.add(image_id)
+                    seen += 1
+                    if phash is not None:
+                        self._add(image_id, phash)
+                # Stop the checkpoint at the first recent image: a smaller id may still be in flight
+                if uploaded_at is not None and uploaded_at.tzinfo is None:  # SQLite hands back naive UTC
+                    uploaded_at = uploaded_at.replace(tzinfo=timezone.utc)
+                settled = settled and (uploaded_at is None or uploaded_at <= settled_before)
+                if settled:
+                    self._max_id = image_id
+                    self._recent.discard(image_id)
+            if rows:
+                last_id = rows[-1][0]
+            if len(rows) < batch_size:
+                return seen
+
+    def _load(self, db: Session):
+        start = time.perf_counter()
+        snapshot = self._read_snapshot()
+        newest = db.query(models.Image.id).order_by(models.Image.id.desc()).limit(1).scalar() or 0
+        # A snapshot from ahead of the database belongs to another (or a reset) database
+        if snapshot and snapshot[0] <= newest:
+            max_id, ids, hashes = snapshot
+            for image_id, phash in zip(ids, hashes):
+                self._add(image_id, phash)
+            self._max_id = max_id
+            self._recent = {image_id for image_id in ids if image_id > max_id}
+            source = "snapshot"
+        else:
+            source = "database"
+        self._catch_up(db)
+        self._loaded = True
+        if source == "database":
+            self._write_snapshot()
+        print(f"🧭 Loaded {len(self._ids)} perceptual hashes from the {source} "
+              f"in {time.perf_counter() - start:.1f}s")
+
+    def _read_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                    raise ValueError("not a similarity index snapshot")
+                header = array("q")
+                header.fromfile(f, 2)
+                max_id, count = header
+                ids, hashes = array("q"), array("Q")
+                ids.fromfile(f, count)
+                hashes.fromfile(f, count)
+            self._snapshot_mtime = os.path.getmtime(self.snapshot_path)
+            return max_id, ids, hashes
+        except (OSError, EOFError, ValueError) as e:
+            print(f"⚠️ Warning: ignoring similarity index snapshot: {e}")
+            return None
+
+    def _write_snapshot(self):
+        if not self.snapshot_path:
+            return
+        temp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(SNAPSHOT_MAGIC)
+                array("q", [self._max_id, len(self._ids)]).tofile(f)
+                self._ids.tofile(f)
+                self._hashes.tofile(f)
+            os.replace(temp_path, self.snapshot_path)
+            self._snapshot_mtime = os.path.getmtime(self.snapshot_path)
+        except OSError as e:
+            print(f"❌ Error writing similarity index snapshot: {e}")
+
+    def load(self, db: Session):
+        with self._lock:
+            if not self._loaded:
+                self._load(db)
+
+    def save(self):
+        """
+        Write the loaded index to the snapshot file, unless another process
+        (or the backfill) has written a newer snapshot since this one was read.
+        """
+        with self._lock:
+            if not self._loaded or not self.snapshot_path:
+                return
+            if os.path.exists(self.snapshot_path) and os.path.getmtime(self.snapshot_path) != self._snapshot_mtime:
+                return
+            self._write_snapshot()
+
+    def query(self, db: Session, phash, max_distance):
+        """
+        [(image_id, distance)] for every indexed image within max_distance
+        bits of phash, closest first (ties by newest id).
+        """
+        start = time.perf_counter()
+        phash &= HASH_MASK
+        with self._lock:
+            if not self._loaded:
+                self._load(db)
+            else:
+                self._catch_up(db)
+
+            chunk_distance = max_distance // CHUNKS
+            masks = self._masks.get(chunk_distance)
+            if masks is None:
+                masks = self._masks[chunk_distance] = _flip_masks(chunk_distance)
+
+            candidates = set()
+            for chunk, table in enumerate(self._tables):
+                value = (phash >> (chunk * CHUNK_BITS)) & CHUNK_MASK
+                for mask in masks:
+                    positions = table.get(value ^ mask)
+                    if positions is not None:
+                        candidates.update(positions)
+
+            ids, hashes = self._ids, self._hashes
+            matches = []
+            for position in candidates:
+                distance = (hashes[position] ^ phash).bit_count()
+                if distance <= max_distance:
+                    matches.append((distance, -ids[position]))
+
+            self._queries += 1
+            self._query_time += time.perf_counter() - start
+        matches.sort()
+        return [(-negative_id, distance) for distance, negative_id in matches]
+
+    def stats(self):
+        return {
+            "loaded": self._loaded,
+            "size": len(self._ids),
+            "max_id": self._max_id,
+            "queries": self._queries,
+            "avg_query_ms": round(self._query_time / self._queries * 1000, 3) if self._queries else 0.0,
+        }
+
+
+similarity_index = SimilarityIndex(settings.SIMILAR_INDEX_PATH)
+
+
+def _hash_thumbnail(url):
+    try:
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"❌ Error downloading {url}: {e}")
+        return None
+    return perceptual_hash_bytes(response.content)
+
+
+def backfill_perceptual_hashes(db: Session, batch_size: int = DEFAULT_BATCH_SIZE, workers: int = 8):
+    """
+    Hash the thumbnails of images stored before perceptual hashes were, in id
+    order, one batch per transaction. Images whose thumbnail can't be
+    fetched keep a NULL hash. Returns the number of images hashed.
+    """
+    hashed = 0
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            rows = db.query(models.Image.id, models.Image.thumbnail_path).filter(
+                models.Image.id > last_id,
+                models.Image.perceptual_hash.is_(None)
+            ).order_by(models.Image.id).limit(batch_size).all()
+            if not rows:
+                break
+
+            hashes = pool.map(_hash_thumbnail, [row.thumbnail_path for row in rows])
+            updates = [
+                {"id": row.id, "perceptual_hash": phash}
+                for row, phash in zip(rows, hashes) if phash is not None
+            ]
+            if updates:
+                db.bulk_update_mappings(models.Image, updates)
+            db.commit()
+
+            hashed += len(updates)
+            last_id = rows[-1].id
+            print(f"🧭 Hashed {hashed} images (up to id {last_id})")
+
+    return hashed
+
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_SIZE
+    db = SessionLocal()
+    try:
+        backfill_perceptual_hashes(db, batch_size)
+        # Start the snapshot over so the next load includes the new hashes
+        if settings.SIMILAR_INDEX_PATH and os.path.exists(settings.SIMILAR_INDEX_PATH):
+            os.remove(settings.SIMILAR_INDEX_PATH)
+        similarity_index.load(db)
+    finally:
+        db.close()
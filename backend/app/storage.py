@@ -0,0 +1,175 @@
+"""
+Storage backends for originals, thumbnails and derivatives.
+
+images.py only talks to the `storage` singleton below, which exposes the
+same calls as CloudinaryClient:
+
+    upload_image(file_data, public_id) -> {"secure_url": ..., "public_id": ...} or None
+    delete_image(public_id) -> bool
+    delete_images(public_ids) -> the public_ids that no longer exist (the rest are retried)
+
+STORAGE_BACKEND picks the implementation: "cloudinary" (default) or "local".
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from .config import settings
+
+CHUNK_SIZE = 1024 * 1024
+
+# Magic numbers for the formats we store, so served files get the right Content-Type
+_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+
+def _sniff_extension(head):
+    for signature, ext in _SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return ".avif"
+    return ""
+
+
+class LocalStorage:
+    """
+    Content-addressed storage on local disk.
+
+    Every distinct file is written once to blobs/<aa>/<bb>/<sha256>. Each
+    public_id is a hard link to its blob under names/, so identical uploads
+    share one copy on disk and the blob's link count doubles as its reference
+    count: the blob is removed when the last public_id pointing at it goes.
+    Files are served by digest from /media (see media.py), which makes every
+    URL immutable and its ETag the digest itself.
+    """
+
+    def __init__(self, root=None, base_url=None):
+        self.root = os.path.abspath(root or settings.LOCAL_STORAGE_ROOT)
+        self.base_url = (settings.LOCAL_STORAGE_BASE_URL if base_url is None else base_url).rstrip("/")
+        self.is_configured = True
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "names"), exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], digest[2:4], digest)
+
+    def _name_path(self, public_id):
+        path = os.path.normpath(os.path.join(self.root, "names", public_id))
+        if not path.startswith(os.path.join(self.root, "names") + os.sep):
+            raise ValueError(f"Invalid public_id: {public_id}")
+        return path
+
+    def _write_temp(self, file_data):
+        """Copy bytes or a file handle to a temp file, returning (temp_path, sha256, extension)"""
+        digest = hashlib.sha256()
+        head = b""
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".incoming-")
+        with os.fdopen(fd, "wb") as temp:
+            if hasattr(file_data, "read"):
+                chunks = iter(lambda: file_data.read(CHUNK_SIZE), b"")
+            else:
+                chunks = [bytes(file_data)]
+            for chunk in chunks:
+                if len(head) < 16:
+                    head += chunk[:16]
+                digest.update(chunk)
+                temp.write(chunk)
+        return temp_path, digest.hexdigest(), _sniff_extension(head)
+
+    def upload_image(self, file_data, public_id, folder=None):
+        """Store a file under public_id (overwriting), returning its URL like Cloudinary does"""
+        if folder:
+            public_id = f"{folder}/{public_id}"
+        temp_path = None
+        try:
+            temp_path, digest, ext = self._write_temp(file_data)
+            blob = self.blob_path(digest)
+            name = self._name_path(public_id)
+
+            with self._lock:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                if os.path.exists(blob):
+                    os.remove(temp_path)
+                else:
+                    os.replace(temp_path, blob)
+                temp_path = None
+
+                os.makedirs(os.path.dirname(name), exist_ok=True)
+                if os.path.exists(name) and not os.path.samefile(name, blob):
+                    self._unlink_name(name)
+                if not os.path.exists(name):
+                    os.link(blob, name)
+
+            print(f"✅ Stored {public_id} as blob {digest[:12]}")
+            return {
+                "public_id": public_id,
+                "secure_url": f"{self.base_url}/media/{digest}{ext}",
+                "etag": digest,
+            }
+        except Exception as e:
+            print(f"❌ Error storing file locally: {e}")
+            return None
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _unlink_name(self, name):
+        # A blob has one link from blobs/ plus one per public_id; when this is
+        # the last public_id, rehash it to find (and drop) the blob as well
+        orphan = None
+        if os.stat(name).st_nlink <= 2:
+            digest = hashlib.sha256()
+            with open(name, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            orphan = self.blob_path(digest.hexdigest())
+        os.remove(name)
+        if orphan and os.path.exists(orphan):
+            os.remove(orphan)
+
+    def delete_image(self, public_id):
+        """Drop public_id, and its blob once nothing else references it"""
+        try:
+            name = self._name_path(public_id)
+            with self._lock:
+                if not os.path.exists(name):
+                    return False
+                self._unlink_name(name)
+            return True
+        except Exception as e:
+            print(f"❌ Error deleting local file: {e}")
+            return False
+
+    def delete_images(self, public_ids):
+        """Drop many public_ids, returning those that are gone (including ones already missing)"""
+        gone = []
+        for public_id in public_ids:
+            try:
+                name = self._name_path(public_id)
+                with self._lock:
+                    if os.path.exists(name):
+                        self._unlink_name(name)
+                gone.append(public_id)
+            except Exception as e:
+                print(f"❌ Error deleting local file {public_id}: {e}")
+        return gone
+
+
+def create_storage():
+    if settings.STORAGE_BACKEND == "local":
+        print(f"💽 Using local storage at {os.path.abspath(settings.LOCAL_STORAGE_ROOT)}")
+        return LocalStorage()
+
+    from .cloudinary_client import cloudinary_client
+    return cloudinary_client
+
+
+storage = create_storage()
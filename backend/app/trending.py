@@ -0,0 +1,247 @@
+"""
+Trending scores for the feed.
+
+Every upload, like and comment is an event worth its weight, halving every
+TRENDING_HALF_LIFE hours. An image's score is the log2 of its events'
+summed worth, measured against a fixed EPOCH rather than "now":
+
+    score = log2(sum(weight * 2 ** ((event_time - EPOCH) / half_life)))
+
+Decaying every event by the same factor never changes the order, so an
+event's contribution is final once added, old scores never need touching,
+and new events are simply folded in (log2 keeps the numbers in range).
+
+Only public images are scored, so the trending feed reads its pages
+straight off the score index without checking privacy per row.
+
+A background job folds in the images, likes and comments created since
+each table's checkpoint, at most TRENDING_BATCH_SIZE rows per table per
+run, and writes scores and checkpoints in one transaction. Checkpoints are
+advanced with compare-and-set, so when two processes pick up the same rows
+only one of them commits.
+
+A checkpoint is the last id folded, but ids are handed out at insert and
+rows only become visible at commit, so a smaller id can still show up
+after a larger one. Each run therefore stops at the first row created
+less than TRENDING_SETTLE_TIME seconds ago; by then every transaction
+that took a smaller id has committed (or never will).
+
+Removed likes are not events, so they keep counting until the scores are
+rebuilt from scratch, from the backend directory:
+
+    python -m app.trending --recompute
+"""
+import asyncio
+import math
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import update, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from . import models
+from .config import settings
+from .database import SessionLocal
+from .versions import GLOBAL, FEED_TRENDING, bump_versions
+from .workers import io_executor
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# Source table -> (model, image id column, event time column, weight)
+SOURCES = {
+    "images": (models.Image, models.Image.id, models.Image.uploaded_at, settings.TRENDING_UPLOAD_WEIGHT),
+    "likes": (models.Like, models.Like.image_id, models.Like.created_at, settings.TRENDING_LIKE_WEIGHT),
+    "comments": (models.Comment, models.Comment.image_id, models.Comment.created_at, settings.TRENDING_COMMENT_WEIGHT),
+}
+
+
+def _aware(when):
+    if when.tzinfo is None:  # SQLite hands back naive UTC timestamps
+        return when.replace(tzinfo=timezone.utc)
+    return when
+
+
+def event_score(when, weight):
+    """The log2 worth of one event at time `when`"""
+    return math.log2(weight) + (_aware(when) - EPOCH).total_seconds() / (settings.TRENDING_HALF_LIFE * 3600)
+
+
+def add_scores(a, b):
+    """log2(2**a + 2**b), without overflowing"""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def _dialect_insert(db: Session, model):
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def _ensure_checkpoints(db: Session):
+    db.execute(
+        _dialect_insert(db, models.TrendingCheckpoint)
+        .values([{"source": source, "last_id": 0} for source in SOURCES])
+        .on_conflict_do_nothing(index_elements=[models.TrendingCheckpoint.source])
+    )
+    db.commit()
+
+
+def fold_new_events(db: Session, batch_size):
+    """
+    Fold up to batch_size new rows per source table into trending_scores.
+    Returns (events folded, whether any table had a full batch waiting).
+    """
+    Checkpoint = models.TrendingCheckpoint
+    checkpoints = dict(db.query(Checkpoint.source, Checkpoint.last_id).all())
+    if len(checkpoints) < len(SOURCES):
+        _ensure_checkpoints(db)
+        checkpoints = dict(db.query(Checkpoint.source, Checkpoint.last_id).all())
+
+    increments = {}
+    new_checkpoints = dict(checkpoints)
+    events = 0
+    full = False
+    settled_before = datetime.now(timezone.utc) - timedelta(seconds=settings.TRENDING_SETTLE_TIME)
+    for source, (model, image_column, time_column, weight) in SOURCES.items():
+        rows = db.query(model.id, image_column, time_column).filter(
+            model.id > checkpoints[source]
+        ).order_by(model.id).limit(batch_size).all()
+        # Stop at the first recent row: a smaller id may still be in flight
+        for position, (_, _, when) in enumerate(rows):
+            if when is not None and _aware(when) > settled_before:
+                rows = rows[:position]
+                break
+        for _, image_id, when in rows:
+            if image_id is not None and when is not None:
+                increments[image_id] = add_scores(increments.get(image_id), event_score(when, weight))
+        if rows:
+            new_checkpoints[source] = rows[-1][0]
+        events += len(rows)
+        full = full or len(rows) == batch_size
+    if not events:
+        db.rollback()
+        return 0, False
+
+    # Every checkpoint is compared in the same order, so a concurrent run on
+    # any table waits here and then finds its checkpoints moved on
+    for source in sorted(SOURCES):
+        claimed = db.execute(
+            update(Checkpoint)
+            .where(Checkpoint.source == source, Checkpoint.last_id == checkpoints[source])
+            .values(last_id=new_checkpoints[source])
+        ).rowcount
+        if claimed != 1:
+            db.rollback()
+            return 0, True
+
+    # Read after claiming, so the scores include any run that committed before ours
+    images = [image_id for (image_id,) in db.query(models.Image.id).filter(
+        models.Image.id.in_(increments), models.Image.privacy == "public"
+    )]
+    current = dict(db.query(models.TrendingScore.image_id, models.TrendingScore.score).filter(
+        models.TrendingScore.image_id.in_(images)
+    ).all())
+    now = datetime.now(timezone.utc)
+    scores = [
+        {"image_id": image_id, "score": add_scores(current.get(image_id), increments[image_id]), "updated_at": now}
+        for image_id in images
+    ]
+    if scores:
+        insert = _dialect_insert(db, models.TrendingScore)
+        db.execute(
+            insert.values(scores).on_conflict_do_update(
+                index_elements=[models.TrendingScore.image_id],
+                set_={"score": insert.excluded.score, "updated_at": insert.excluded.updated_at}
+            )
+        )
+        # The trending feed's order changed
+        bump_versions(db, [GLOBAL, FEED_TRENDING])
+    db.commit()
+    return events, full
+
+
+def reset_trending_scores(db: Session):
+    """Drop every score and rewind the checkpoints, so the job rebuilds them from the first row"""
+    _ensure_checkpoints(db)
+    db.execute(delete(models.TrendingScore))
+    db.execute(update(models.TrendingCheckpoint).values(last_id=0))
+    bump_versions(db, [GLOBAL, FEED_TRENDING])
+    db.commit()
+
+
+class TrendingWorker:
+    """Background task folding new events into the trending scores"""
+
+    def __init__(self, batch_size, interval):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._task = None
+        self._runs = 0
+        self._events = 0
+        self._last_run = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._work())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _work(self):
+        while True:
+            try:
+                _, more = await io_executor.run(self.run_once)
+            except Exception as e:
+                print(f"❌ Error updating trending scores: {e}")
+                more = False
+
+            # A full batch means there is probably more waiting
+            if not more:
+                await asyncio.sleep(self.interval)
+
+    def run_once(self):
+        """One bounded run: at most batch_size new rows from each source table"""
+        start = time.perf_counter()
+        db = SessionLocal()
+        try:
+            events, more = fold_new_events(db, self.batch_size)
+        finally:
+            db.close()
+        self._runs += 1
+        self._events += events
+        self._last_run = time.perf_counter() - start
+        return events, more
+
+    def stats(self):
+        return {
+            "runs": self._runs,
+            "events": self._events,
+            "last_run_ms": round(self._last_run * 1000, 1),
+        }
+
+
+trending_worker = TrendingWorker(
+    batch_size=settings.TRENDING_BATCH_SIZE,
+    interval=settings.TRENDING_INTERVAL,
+)
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        if "--recompute" in sys.argv[1:]:
+            reset_trending_scores(db)
+            print("📈 Cleared trending scores, rebuilding from the first events")
+        folded = 0
+        while True:
+            events, more = fold_new_events(db, settings.TRENDING_BATCH_SIZE)
+            folded += events
+            if not more:
+                break
+        print(f"📈 Folded {folded} events into trending scores")
+    finally:
+        db.close()
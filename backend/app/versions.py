@@ -0,0 +1,108 @@
+"""
+Change versions for conditional GETs.
+
+Every write that changes what a list endpoint returns bumps a counter in
+cache_versions, in the same transaction as the change:
+
+    "global"        anything visible in the public feed (public images, their likes and comments)
+    "user:<id>"     anything only that user sees: their gallery and their likes
+    "profile:<id>"  the user record itself (/users/me), and their name wherever it shows
+    "image:<id>"    one public image: its likes, comments or deletion
+    "feed:recent"   a public image added or deleted, shifting the recent feed's pages without a cursor
+    "feed:trending" the order of the trending feed
+
+The finer versions let the feed page cache (feed_cache.py) drop only the
+pages a write actually changed.
+
+Read endpoints build a strong ETag from the versions they depend on, so a
+client's cached copy is validated with one small query and, when nothing
+changed, answered with a 304 before any list query or serialization runs.
+"""
+import hashlib
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from . import models
+
+GLOBAL = "global"
+FEED_RECENT = "feed:recent"
+FEED_TRENDING = "feed:trending"
+
+# The client must revalidate every time, and only its own (private) cache may store the response
+CACHE_HEADERS = {
+    "Cache-Control": "private, no-cache",
+    "Vary": "Authorization",
+}
+
+
+def user_scope(user_id):
+    return f"user:{user_id}"
+
+
+def profile_scope(user_id):
+    return f"profile:{user_id}"
+
+
+def image_scope(image_id):
+    return f"image:{image_id}"
+
+
+def image_scopes(owner_id, privacy, image_id=None):
+    """The versions a change to one of owner_id's images affects"""
+    if privacy != "public":
+        return [user_scope(owner_id)]
+    return [user_scope(owner_id), GLOBAL] + ([image_scope(image_id)] if image_id is not None else [])
+
+
+def new_image_scopes(owner_id, privacy):
+    """The versions adding an image for owner_id affects"""
+    return [user_scope(owner_id)] + ([GLOBAL, FEED_RECENT] if privacy == "public" else [])
+
+
+def deleted_image_scopes(owner_id, privacy, image_id):
+    """The versions deleting one of owner_id's images affects"""
+    return image_scopes(owner_id, privacy, image_id) + ([FEED_RECENT] if privacy == "public" else [])
+
+
+def bump_versions(db, scopes):
+    """Advance the given versions; db is a Session or Connection and the caller commits"""
+    scopes = sorted(set(scopes))  # A fixed lock order, so concurrent bumps can't deadlock
+    if not scopes:
+        return
+    dialect = db.get_bind().dialect if hasattr(db, "get_bind") else db.dialect
+    insert = (postgresql if dialect.name == "postgresql" else sqlite).insert(models.CacheVersion)
+    db.execute(
+        insert.values([{"scope": scope, "version": 1} for scope in scopes])
+        .on_conflict_do_update(
+            index_elements=[models.CacheVersion.scope],
+            set_={"version": models.CacheVersion.version + 1}
+        )
+    )
+
+
+def get_versions(db, scopes):
+    rows = db.execute(
+        select(models.CacheVersion.scope, models.CacheVersion.version)
+        .where(models.CacheVersion.scope.in_(scopes))
+    ).all()
+    versions = dict(rows)
+    return [versions.get(scope, 0) for scope in scopes]
+
+
+def not_modified(request: Request, response: Response, db, scopes, *key):
+    """
+    Set ETag and caching headers on response from the current versions of
+    scopes plus key (the endpoint, the user and anything else the body
+    depends on) and the query string. Returns a ready 304 when the client's
+    If-None-Match still matches, otherwise None.
+    """
+    parts = [str(part) for part in key] + [str(version) for version in get_versions(db, scopes)]
+    parts.append(str(sorted(request.query_params.multi_items())))
+    etag = f'"{hashlib.sha256("|".join(parts).encode()).hexdigest()[:32]}"'
+
+    headers = {"ETag": etag, **CACHE_HEADERS}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,117 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException
+from .config import settings
+
+
+class BoundedExecutor:
+    """
+    An executor that refuses new work once too many jobs are queued.
+
+    Handlers await `run()` so CPU-bound or blocking calls never stall the
+    event loop. When `max_pending` jobs are already waiting or running the
+    call fails fast with a 503 instead of piling up unbounded work.
+    """
+
+    def __init__(self, name, make_executor, max_workers, max_pending):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._make_executor = make_executor
+        self._executor = None
+        self._pending = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created lazily so importing the app never forks worker processes
+        if self._executor is None:
+            self._executor = self._make_executor(self.max_workers)
+        return self._executor
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"Server busy ({self.name} queue full). Please try again.",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is freed when the job ends, not when the caller stops waiting:
+        # a cancelled await leaves a started job running
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "queue_depth": max(self._pending - self.max_workers, 0),
+            "max_pending": self.max_pending,
+            "rejected": self._rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _image_executor(max_workers):
+    # IMAGE_PROCESS_WORKERS=0 keeps Pillow work in threads (Pillow releases the GIL for most codecs)
+    if settings.IMAGE_PROCESS_WORKERS > 0:
+        # Not fork: a child forked while another thread holds a lock (stdout, the pool's own) can deadlock
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("forkserver"))
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image")
+
+
+# Decode, thumbnail and encode work
+image_executor = BoundedExecutor(
+    "image",
+    _image_executor,
+    max_workers=settings.IMAGE_PROCESS_WORKERS or settings.IO_THREAD_WORKERS,
+    max_pending=settings.IMAGE_QUEUE_LIMIT,
+)
+
+# Blocking network calls (Cloudinary SDK, AI provider)
+io_executor = BoundedExecutor(
+    "io",
+    lambda max_workers: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="io"),
+    max_workers=settings.IO_THREAD_WORKERS,
+    max_pending=settings.IO_QUEUE_LIMIT,
+)
+
+# bcrypt hashing and verification (the bcrypt C code releases the GIL)
+password_executor = BoundedExecutor(
+    "password",
+    lambda max_workers: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password"),
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_QUEUE_LIMIT,
+)
+
+
+def worker_stats():
+    return {
+        "image": image_executor.stats(),
+        "io": io_executor.stats(),
+        "password": password_executor.stats(),
+    }
+
+
+def shutdown_workers():
+    image_executor.shutdown()
+    io_executor.shutdown()
+    password_executor.shutdown()
@@ -0,0 +1,69 @@
+"""
+The app under test runs against a throwaway SQLite database and local
+storage. Settings are read from the environment when app is imported, so
+they are set here first. Background workers only start with the app's
+lifespan, which the plain TestClient below never enters.
+"""
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+_TMP = tempfile.mkdtemp(prefix="image-gallery-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_TMP}/test.db",
+    STORAGE_BACKEND="local",
+    LOCAL_STORAGE_ROOT=os.path.join(_TMP, "media"),
+    SIMILAR_INDEX_PATH="",
+    BCRYPT_ROUNDS="4",
+    METRICS_TOKEN="metrics-token",
+)
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.main import app
+from app.database import SessionLocal, engine
+
+
+@pytest.fixture(scope="session")
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(scope="session")
+def register(client):
+    """Register a new user and return (user id, auth headers)"""
+    def register(full_name="Test User"):
+        email = f"{uuid.uuid4().hex}@example.com"
+        user = client.post("/register", json={"email": email, "full_name": full_name, "password": "pw"}).json()
+        token = client.post("/login", json={"email": email, "password": "pw"}).json()["access_token"]
+        return user["id"], {"Authorization": f"Bearer {token}"}
+    return register
+
+
+@pytest.fixture
+def count_statements():
+    """A context manager collecting the SQL statements run inside it"""
+    @contextmanager
+    def count_statements():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return count_statements
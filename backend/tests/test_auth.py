@@ -0,0 +1,45 @@
+"""Authentication"""
+from passlib.context import CryptContext
+from app import models
+from app.config import settings
+from app.versions import GLOBAL, get_versions
+
+
+def test_cached_user_skips_the_users_query(client, register, count_statements):
+    _, headers = register()
+    assert client.get("/users/me", headers=headers).status_code == 200  # Verifies and caches the token
+
+    with count_statements() as statements:
+        response = client.get("/users/me", headers=headers)
+
+    assert response.status_code == 200
+    assert not [statement for statement in statements if "FROM users" in statement], statements
+
+
+def global_version(db):
+    db.expire_all()
+    return get_versions(db, [GLOBAL])[0]
+
+
+def test_password_rehash_at_login_keeps_cached_pages(client, db, register):
+    user_id, _ = register()
+    user = db.get(models.User, user_id)
+    user.hashed_password = CryptContext(schemes=["bcrypt"]).hash("pw", rounds=settings.BCRYPT_ROUNDS + 1)
+    db.commit()
+    stale_hash, before = user.hashed_password, global_version(db)
+
+    assert client.post("/login", json={"email": user.email, "password": "pw"}).status_code == 200
+
+    db.refresh(user)
+    assert user.hashed_password != stale_hash  # Rehashed at BCRYPT_ROUNDS
+    assert global_version(db) == before
+
+
+def test_renaming_a_user_invalidates_public_pages(db, register):
+    user_id, _ = register()
+    before = global_version(db)
+
+    db.get(models.User, user_id).full_name = "Renamed"
+    db.commit()
+
+    assert global_version(db) == before + 1
@@ -0,0 +1,79 @@
+"""Comment pages and the feed's comment preview"""
+import uuid
+from sqlalchemy import event
+from app import models
+from app.config import settings
+from app.database import engine
+
+
+def add_image(db, owner_id):
+    image = models.Image(
+        filename=f"images/{uuid.uuid4()}.jpg", file_path="http://example.com/a.jpg",
+        thumbnail_path="http://example.com/a-thumb.jpg", width=10, height=10,
+        uploaded_by=owner_id, privacy="public",
+    )
+    db.add(image)
+    db.commit()
+    return image
+
+
+def comment_on(client, image_id, headers, count):
+    for n in range(count):
+        response = client.post(
+            f"/api/images/{image_id}/comment", json={"content": f"Comment {n}", "image_id": image_id}, headers=headers
+        )
+        assert response.status_code == 200
+
+
+def test_feed_embeds_only_the_latest_comments(client, db, register):
+    user_id, headers = register()
+    image = add_image(db, user_id)
+    comment_on(client, image.id, headers, settings.FEED_COMMENT_PREVIEW + 5)
+
+    feed = client.get("/api/feed", params={"limit": 1}, headers=headers).json()
+
+    assert feed[0]["id"] == image.id
+    assert feed[0]["comment_count"] == settings.FEED_COMMENT_PREVIEW + 5
+    assert [comment["content"] for comment in feed[0]["comments"]] == [
+        f"Comment {n}" for n in range(5, settings.FEED_COMMENT_PREVIEW + 5)
+    ]
+
+
+def test_comment_pages_follow_the_cursor_through_every_comment(client, db, register):
+    user_id, headers = register()
+    image = add_image(db, user_id)
+    comment_on(client, image.id, headers, 7)
+
+    contents, cursor = [], None
+    while True:
+        response = client.get(f"/api/images/{image.id}/comments", params={"limit": 3, "cursor": cursor}, headers=headers)
+        contents += [comment["content"] for comment in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert contents == [f"Comment {n}" for n in reversed(range(7))]
+
+
+def test_comment_page_after_a_cursor_seeks_the_index(client, db, register):
+    user_id, headers = register()
+    image = add_image(db, user_id)
+    comment_on(client, image.id, headers, 4)
+    cursor = client.get(f"/api/images/{image.id}/comments", params={"limit": 2}, headers=headers).headers["X-Next-Cursor"]
+
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        client.get(f"/api/images/{image.id}/comments", params={"limit": 2, "cursor": cursor}, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    statement, parameters = next((s, p) for s, p in executed if "FROM comments" in s)
+    with engine.connect() as connection:
+        plan = " ".join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+    assert "ix_comments_image_id_created_at_id" in plan, plan
+    assert "TEMP B-TREE" not in plan, plan
@@ -0,0 +1,40 @@
+"""Engine configuration and behaviour under concurrent writes"""
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from app import models
+from app.config import settings
+from app.database import engine, pool_stats
+
+
+def test_sqlite_connections_get_the_configured_pragmas():
+    with engine.connect() as connection:
+        pragma = lambda name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        assert pragma("journal_mode").lower() == settings.SQLITE_JOURNAL_MODE.lower()
+        assert pragma("busy_timeout") == settings.SQLITE_BUSY_TIMEOUT
+        assert pragma("synchronous") == {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3}[settings.SQLITE_SYNCHRONOUS.upper()]
+
+
+def test_concurrent_writes_all_succeed(client, db, register):
+    user_id, headers = register()
+    image = models.Image(
+        filename=f"images/{uuid.uuid4()}.jpg", file_path="http://example.com/a.jpg",
+        thumbnail_path="http://example.com/a-thumb.jpg", width=10, height=10,
+        uploaded_by=user_id, privacy="public",
+    )
+    db.add(image)
+    db.commit()
+    timeouts = pool_stats()["timeouts"]
+
+    def comment(n):
+        return client.post(
+            f"/api/images/{image.id}/comment", json={"content": f"Comment {n}", "image_id": image.id}, headers=headers
+        ).status_code
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        statuses = list(pool.map(comment, range(100)))
+
+    # Writers queue on the busy timeout instead of failing with "database is locked"
+    assert statuses == [200] * 100
+    db.refresh(image)
+    assert image.comment_count == 100
+    assert pool_stats()["timeouts"] == timeouts
@@ -0,0 +1,28 @@
+"""Cached feed pages are never served after a write that changed them"""
+import uuid
+from app import models
+
+
+def test_deleting_an_image_shifts_cached_skip_pages(client, db, register):
+    user_id, headers = register()
+    images = [
+        models.Image(
+            filename=f"images/{uuid.uuid4()}.jpg", file_path="http://example.com/a.jpg",
+            thumbnail_path="http://example.com/a-thumb.jpg", width=10, height=10,
+            uploaded_by=user_id, privacy="public",
+        )
+        for _ in range(3)
+    ]
+    db.add_all(images)
+    db.commit()
+    newest, middle, oldest = sorted(image.id for image in images)[::-1]
+
+    # A page's first build is kept unverified; the second is cached
+    for _ in range(2):
+        page = client.get("/api/feed", params={"skip": 1, "limit": 1}, headers=headers).json()
+    assert [image["id"] for image in page] == [middle]
+
+    assert client.delete(f"/api/images/{newest}", headers=headers).status_code == 200
+
+    page = client.get("/api/feed", params={"skip": 1, "limit": 1}, headers=headers).json()
+    assert [image["id"] for image in page] == [oldest]
@@ -0,0 +1,26 @@
+"""Concurrent like toggles must leave the likes table and the counter in agreement"""
+from concurrent.futures import ThreadPoolExecutor
+from app import models
+
+
+def test_concurrent_toggles_keep_one_like_and_a_matching_count(client, db, register):
+    user_id, headers = register()
+    image = models.Image(
+        filename="images/toggle.jpg", file_path="http://example.com/toggle.jpg",
+        thumbnail_path="http://example.com/toggle-thumb.jpg", width=10, height=10,
+        uploaded_by=user_id, privacy="public",
+    )
+    db.add(image)
+    db.commit()
+
+    def toggle(_):
+        return client.post(f"/api/images/{image.id}/like", headers=headers).status_code
+
+    with ThreadPoolExecutor(max_workers=50) as pool:
+        statuses = list(pool.map(toggle, range(50)))
+    assert set(statuses) == {200}
+
+    db.expire_all()
+    likes = db.query(models.Like).filter(models.Like.image_id == image.id).count()
+    assert likes in (0, 1)
+    assert db.get(models.Image, image.id).like_count == likes
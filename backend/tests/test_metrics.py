@@ -0,0 +1,11 @@
+"""/metrics is only for callers holding METRICS_TOKEN"""
+
+
+def test_metrics_need_the_metrics_token(client, register):
+    _, headers = register()
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers=headers).status_code == 401
+
+    response = client.get("/metrics", headers={"Authorization": "Bearer metrics-token"})
+    assert response.status_code == 200
+    assert "workers" in response.json()
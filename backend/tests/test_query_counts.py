@@ -0,0 +1,67 @@
+"""List endpoints must run the same number of statements whatever the page size"""
+import pytest
+from app import models
+from app.database import SessionLocal
+from app.feed_cache import feed_cache
+
+
+@pytest.fixture(scope="module")
+def gallery(register):
+    """An owner with 60 public images, each liked and commented on by other users"""
+    owner_id, headers = register("Owner")
+    others = [register(f"Fan {n}")[0] for n in range(3)]
+    db = SessionLocal()
+    try:
+        images = [
+            models.Image(
+                filename=f"images/{owner_id}-{n}.jpg", file_path=f"http://example.com/{n}.jpg",
+                thumbnail_path=f"http://example.com/{n}-thumb.jpg", width=10, height=10,
+                uploaded_by=owner_id, privacy="public", title=f"Image {n}",
+            )
+            for n in range(60)
+        ]
+        db.add_all(images)
+        db.flush()
+        for image in images:
+            for user_id in others:
+                db.add(models.Like(user_id=user_id, image_id=image.id))
+                db.add(models.Comment(user_id=user_id, image_id=image.id, content="Nice"))
+            image.like_count = image.comment_count = len(others)
+        db.add(models.Like(user_id=owner_id, image_id=images[-1].id))
+        db.commit()
+    finally:
+        db.close()
+    return headers
+
+
+@pytest.mark.parametrize("path", ["/api/feed", "/api/images"])
+def test_statement_count_does_not_grow_with_page_size(client, gallery, count_statements, path):
+    client.get(path, params={"limit": 5}, headers=gallery)  # Caches the authenticated user
+
+    counts = {}
+    for limit in (5, 50):
+        feed_cache.local.clear()
+        with count_statements() as statements:
+            response = client.get(path, params={"limit": limit}, headers=gallery)
+        assert response.status_code == 200
+        assert len(response.json()) == limit
+        counts[limit] = len(statements)
+
+    assert counts[5] == counts[50], counts
+
+
+def test_cached_feed_page_statement_count_does_not_grow_with_page_size(client, gallery, count_statements):
+    counts = {}
+    for limit in (5, 50):
+        # A page's first build is kept unverified; the second is cached
+        for _ in range(2):
+            client.get("/api/feed", params={"limit": limit}, headers=gallery)
+        hits = feed_cache.stats()["hits"]
+        with count_statements() as statements:
+            response = client.get("/api/feed", params={"limit": limit}, headers=gallery)
+        assert response.status_code == 200
+        assert len(response.json()) == limit
+        assert feed_cache.stats()["hits"] == hits + 1
+        counts[limit] = len(statements)
+
+    assert counts[5] == counts[50], counts
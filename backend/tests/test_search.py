@@ -0,0 +1,83 @@
+"""Keyword and facet search"""
+import re
+import uuid
+from sqlalchemy import event
+from app import models
+from app.database import engine
+
+
+def add_image(db, owner_id, **columns):
+    image = models.Image(
+        filename=f"images/{uuid.uuid4()}.jpg", file_path="http://example.com/a.jpg",
+        thumbnail_path="http://example.com/a-thumb.jpg", width=10, height=10,
+        uploaded_by=owner_id, **{"privacy": "public", **columns},
+    )
+    db.add(image)
+    db.commit()
+    return image
+
+
+def test_blank_keyword_with_a_filter_searches_by_filter_alone(client, db, register):
+    user_id, headers = register()
+    make = f"Make {uuid.uuid4().hex}"
+    image = add_image(db, user_id, camera_make=make)
+
+    response = client.get("/api/images/search", params={"keyword": "  ", "camera_make": make}, headers=headers)
+
+    assert response.status_code == 200
+    assert [result["id"] for result in response.json()] == [image.id]
+
+
+def test_blank_keyword_without_a_filter_is_rejected(client, register):
+    _, headers = register()
+    response = client.get("/api/images/search", params={"keyword": "  "}, headers=headers)
+    assert response.status_code == 400
+
+
+def search(client, headers, keyword):
+    response = client.get("/api/images/search", params={"keyword": keyword}, headers=headers)
+    assert response.status_code == 200
+    return [result["id"] for result in response.json()]
+
+
+def test_keyword_search_ranks_prefix_matches_and_respects_privacy(client, db, register):
+    user_id, headers = register()
+    other_id, _ = register()
+    word = f"zq{uuid.uuid4().hex[:8]}"
+    in_caption = add_image(db, user_id, caption=f"{word}land at dusk")
+    in_title = add_image(db, user_id, title=f"{word}land")
+    add_image(db, other_id, title=f"{word}land", privacy="private")
+
+    assert search(client, headers, word) == [in_title.id, in_caption.id]
+
+
+def test_search_index_follows_edits(client, db, register):
+    user_id, headers = register()
+    old, new = f"zq{uuid.uuid4().hex[:8]}", f"zq{uuid.uuid4().hex[:8]}"
+    image = add_image(db, user_id, title=old)
+
+    image.title = new
+    db.commit()
+
+    assert search(client, headers, old) == []
+    assert search(client, headers, new) == [image.id]
+
+
+def test_keyword_search_reads_the_full_text_index_not_every_image(client, register):
+    _, headers = register()
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        search(client, headers, "sunset")
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    statement, parameters = next((s, p) for s, p in executed if "MATCH" in s)
+    with engine.connect() as connection:
+        plan = " ".join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+    assert "images_fts VIRTUAL TABLE INDEX" in plan, plan
+    assert not re.search(r"SCAN images\b(?!_fts)", plan), plan
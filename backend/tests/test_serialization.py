@@ -0,0 +1,56 @@
+"""The lean list path must send exactly what the routes' response models describe"""
+import uuid
+import typing
+from pydantic import BaseModel
+from app import models, schemas
+
+
+def assert_matches_schema(schema, data):
+    """data validates against schema and has exactly its fields, recursively"""
+    schema.model_validate(data)
+    assert set(data) == set(schema.model_fields), set(data) ^ set(schema.model_fields)
+    for name, field in schema.model_fields.items():
+        value = data[name]
+        annotation = field.annotation
+        if typing.get_origin(annotation) is typing.Union:  # Optional[...]
+            annotation = next(arg for arg in typing.get_args(annotation) if arg is not type(None))
+        if value is None:
+            continue
+        if typing.get_origin(annotation) is list:
+            item_schema = typing.get_args(annotation)[0]
+            if isinstance(item_schema, type) and issubclass(item_schema, BaseModel):
+                for item in value:
+                    assert_matches_schema(item_schema, item)
+        elif isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            assert_matches_schema(annotation, value)
+
+
+def test_list_pages_match_their_response_models(client, db, register):
+    user_id, headers = register()
+    image = models.Image(
+        filename=f"images/{uuid.uuid4()}.jpg", file_path="http://example.com/a.jpg",
+        thumbnail_path="http://example.com/a-thumb.jpg", width=640, height=480,
+        uploaded_by=user_id, privacy="public", title="Lean", camera_make="Acme",
+        derivatives=[{"width": 320, "height": 240, "format": "webp",
+                      "url": "http://example.com/a-320.webp", "public_id": "derivatives/a_320w.webp"}],
+    )
+    db.add(image)
+    db.commit()
+    assert client.post(f"/api/images/{image.id}/like", headers=headers).status_code == 200
+    assert client.post(
+        f"/api/images/{image.id}/comment", json={"content": "Nice", "image_id": image.id}, headers=headers
+    ).status_code == 200
+
+    [own] = client.get("/api/images", params={"limit": 1}, headers=headers).json()
+    [public] = client.get("/api/feed", params={"limit": 1}, headers=headers).json()
+
+    assert_matches_schema(schemas.Image, own)
+    assert_matches_schema(schemas.PublicImage, public)
+    for item in (own, public):
+        assert item["id"] == image.id
+        assert item["is_liked"] is True
+        assert item["like_count"] == 1
+        assert item["derivatives"] == [
+            {"width": 320, "height": 240, "format": "webp", "url": "http://example.com/a-320.webp"}
+        ]
+    assert [comment["content"] for comment in public["comments"]] == ["Nice"]
@@ -0,0 +1,46 @@
+"""The in-memory perceptual hash index"""
+import random
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app import models
+from app.similarity import SimilarityIndex
+
+
+def add_image(db, image_id, phash, **columns):
+    db.add(models.Image(
+        id=image_id, filename=f"images/{uuid.uuid4()}.jpg", file_path="http://example.com/a.jpg",
+        thumbnail_path="http://example.com/a-thumb.jpg", width=10, height=10,
+        privacy="public", perceptual_hash=phash, **columns,
+    ))
+    db.commit()
+
+
+def test_late_committing_smaller_id_is_still_indexed(db):
+    index = SimilarityIndex(None)
+    newest = db.query(func.max(models.Image.id)).scalar() or 0
+    late_hash, early_hash = random.getrandbits(63), random.getrandbits(63)
+
+    # The larger id commits first and is indexed...
+    add_image(db, newest + 10, early_hash)
+    assert index.query(db, early_hash, 0) == [(newest + 10, 0)]
+    # ...then the smaller one, taken before it, commits
+    add_image(db, newest + 5, late_hash)
+    assert index.query(db, late_hash, 0) == [(newest + 5, 0)]
+    assert index.stats()["size"] == len(index._ids) == len(set(index._ids))
+
+
+def test_settled_images_move_the_checkpoint(db):
+    index = SimilarityIndex(None)
+    newest = db.query(func.max(models.Image.id)).scalar() or 0
+    an_hour_ago = datetime.utcnow() - timedelta(hours=1)
+    add_image(db, newest + 1, random.getrandbits(63), uploaded_at=an_hour_ago)
+    add_image(db, newest + 2, random.getrandbits(63))
+    add_image(db, newest + 3, random.getrandbits(63), uploaded_at=an_hour_ago)
+
+    index._max_id = newest  # As if caught up with every image before these
+    index.load(db)
+
+    # Stops at the recent image; the ones after it are indexed but looked for again
+    assert index.stats()["max_id"] == newest + 1
+    assert {newest + 2, newest + 3} <= set(index._ids)
@@ -0,0 +1,78 @@
+"""
+An upload's bytes are streamed to disk, never held in memory whole.
+
+The request body is fed to the app in small chunks straight from a file,
+as a server would, since TestClient reads the whole body into memory first.
+Python allocations in this process are traced; decoding runs in the image
+workers, so it isn't counted.
+"""
+import asyncio
+import os
+import tracemalloc
+import uuid
+from PIL import Image
+from app.main import app
+
+BODY_CHUNK = 64 * 1024
+# Peak Python memory one upload may use, whatever the file size
+MEMORY_BOUND = 6 * 1024 * 1024
+
+
+def multipart_body(path, filename, content_type):
+    """The chunks of a multipart/form-data body holding the file at path, and its boundary"""
+    boundary = uuid.uuid4().hex
+    yield boundary
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+    with open(path, "rb") as f:
+        while chunk := f.read(BODY_CHUNK):
+            yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+async def post_streamed(path, headers, body):
+    boundary = next(body)
+    chunk = next(body)
+    responses = []
+
+    async def receive():
+        nonlocal chunk
+        if chunk is None:
+            return {"type": "http.disconnect"}
+        message = {"type": "http.request", "body": chunk}
+        chunk = next(body, None)
+        message["more_body"] = chunk is not None
+        return message
+
+    async def send(message):
+        responses.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={boundary}".encode())]
+                   + [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        "client": ("testclient", 50000), "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+    return next(message["status"] for message in responses if message["type"] == "http.response.start")
+
+
+def test_upload_peak_memory_stays_bounded(register, tmp_path):
+    _, headers = register()
+    path = tmp_path / "noise.png"
+    Image.effect_noise((4000, 4000), 64).save(path)  # Noise doesn't compress: about 16 MB
+    assert os.path.getsize(path) > 2 * MEMORY_BOUND
+
+    tracemalloc.start()
+    try:
+        status = asyncio.run(post_streamed("/api/upload", headers, multipart_body(path, "noise.png", "image/png")))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert status == 200
+    assert peak < MEMORY_BOUND, f"peak {peak / 1024 / 1024:.1f} MB"
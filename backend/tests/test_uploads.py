@@ -0,0 +1,34 @@
+"""Uploads through the API, stored in the local test storage"""
+import io
+from PIL import Image
+
+
+def encode(color, format, **params):
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 30), color).save(buffer, format, **params)
+    return buffer.getvalue()
+
+
+def with_camera(make):
+    exif = Image.Exif()
+    exif[0x010F] = make  # Make
+    return exif
+
+
+def test_batch_upload_writes_one_insert_for_files_with_and_without_exif(client, register, count_statements):
+    _, headers = register()
+    jpeg = encode("red", "JPEG", exif=with_camera("Acme"))
+    files = [
+        ("files", ("camera.jpg", jpeg, "image/jpeg")),
+        ("files", ("plain.png", encode("blue", "PNG"), "image/png")),
+        ("files", ("again.jpg", jpeg, "image/jpeg")),
+    ]
+    with count_statements() as statements:
+        response = client.post("/api/upload/batch", headers=headers, files=files)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["success"] for result in results] == [True, True, True]
+    assert [result["image"]["camera_make"] for result in results] == ["Acme", None, "Acme"]
+    inserts = [statement for statement in statements if statement.startswith("INSERT INTO images")]
+    assert len(inserts) == 1, inserts
@@ -0,0 +1,61 @@
+"""BoundedExecutor's queue limit and accounting"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fastapi import HTTPException
+from app.workers import BoundedExecutor
+
+
+@pytest.fixture
+def executor():
+    executor = BoundedExecutor(
+        "test", lambda max_workers: ThreadPoolExecutor(max_workers=max_workers), max_workers=1, max_pending=2
+    )
+    yield executor
+    executor.shutdown()
+
+
+def test_rejects_work_past_max_pending(executor):
+    release = threading.Event()
+
+    async def main():
+        jobs = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(HTTPException) as rejected:
+                await executor.run(release.wait)
+        finally:
+            release.set()
+        await asyncio.gather(*jobs)
+        return rejected.value
+
+    rejected = asyncio.run(main())
+    assert rejected.status_code == 503
+    assert executor.stats()["rejected"] == 1
+    assert executor.stats()["pending"] == 0
+
+
+def test_cancelled_caller_keeps_the_slot_until_the_job_ends(executor):
+    started, release = threading.Event(), threading.Event()
+
+    def job():
+        started.set()
+        release.wait()
+
+    async def main():
+        task = asyncio.ensure_future(executor.run(job))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    try:
+        asyncio.run(main())
+        assert executor.stats()["pending"] == 1  # Still running in its thread
+    finally:
+        release.set()
+    deadline = time.monotonic() + 5
+    while executor.stats()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert executor.stats()["pending"] == 0
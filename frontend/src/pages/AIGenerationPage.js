@@ -7,11 +7,14 @@ import axios from 'axios';
 import './AIGenerationPage.css';
 import { API_BASE_URL, getAuthHeaders } from '../config/api';
 
+const JOB_POLL_INTERVAL = 2000;
+
 const AIGenerationPage = () => {
   const { currentUser, loading: authLoading } = useAuth();
   const navigate = useNavigate();
   const [prompt, setPrompt] = useState('');
   const [negativePrompt, setNegativePrompt] = useState('');
+  const [seed, setSeed] = useState(''); // Same prompt and seed give the same image
   const [title, setTitle] = useState(''); // Add title state
   const [caption, setCaption] = useState(''); // Add caption state
   const [generating, setGenerating] = useState(false);
@@ -39,6 +42,7 @@ const AIGenerationPage = () => {
       const formData = new FormData();
       formData.append('prompt', prompt);
       if (negativePrompt) formData.append('negative_prompt', negativePrompt);
+      if (seed !== '') formData.append('seed', seed);
       formData.append('privacy', 'private');
       
       // Add optional fields - only if they have values
@@ -56,13 +60,30 @@ const AIGenerationPage = () => {
           headers: {
             'Authorization': `Bearer ${token}`,
             'Content-Type': 'multipart/form-data'
-          },
-          timeout: 120000 // 2 minutes timeout for AI generation
+          }
         }
       );
 
-      if (response.data.success) {
-        setGeneratedImage(response.data.image.file_path);
+      // Generation runs as a background job; poll until it finishes
+      let job = response.data.job;
+      const deadline = Date.now() + 300000; // Give up after 5 minutes
+      while (job.status === 'queued' || job.status === 'running') {
+        if (Date.now() > deadline) {
+          setError('AI generation is taking longer than expected. Check your gallery later.');
+          return;
+        }
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+        const jobResponse = await axios.get(
+          `${API_BASE_URL}/api/ai-jobs/${job.id}`,
+          { headers: { 'Authorization': `Bearer ${token}` } }
+        );
+        job = jobResponse.data;
+      }
+
+      if (job.status === 'failed') {
+        setError(job.error || 'Failed to generate image. Please try again.');
+      } else if (job.image) {
+        setGeneratedImage(job.image.file_path);
         // Clear the form after successful generation
         setPrompt('');
         setNegativePrompt('');
@@ -74,7 +95,7 @@ const AIGenerationPage = () => {
       
       // Better error handling
       if (error.response?.status === 503) {
-        setError('AI model is loading. Please try again in 30-60 seconds.');
+        setError('AI generation is busy. Please try again in 30-60 seconds.');
       } else if (error.response?.status === 401) {
         setError('Authentication error. Please log in again.');
       } else if (error.response?.data?.detail) {
@@ -133,6 +154,17 @@ const AIGenerationPage = () => {
               />
             </div>
 
+            <div className="form-group">
+              <label>Seed (optional, for a reproducible image)</label>
+              <input
+                type="number"
+                min="0"
+                value={seed}
+                onChange={(e) => setSeed(e.target.value)}
+                placeholder="42"
+              />
+            </div>
+
             <div className="form-group">
               <label>Title (optional)</label>
               <input
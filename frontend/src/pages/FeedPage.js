@@ -99,7 +99,7 @@ const FeedPage = () => {
             return {
               ...image,
               comments: updatedComments,
-              comment_count: updatedComments.length
+              comment_count: (image.comment_count || 0) + 1
             };
           }
           return image;
@@ -126,7 +126,30 @@ const FeedPage = () => {
     }
   };
 
+  const fetchAllComments = async (imageId) => {
+    try {
+      const token = localStorage.getItem('token');
+      // The feed only embeds the latest few comments, so load the rest on demand
+      const response = await axios.get(`${API_BASE_URL}/api/images/${imageId}/comments`, {
+        params: { limit: 100 },
+        headers: {
+          'Authorization': `Bearer ${token}`
+        }
+      });
+      const comments = [...response.data].reverse();
+      setPublicImages(prev => prev.map(image =>
+        image.id === imageId ? { ...image, comments } : image
+      ));
+    } catch (error) {
+      console.error('Error fetching comments:', error);
+    }
+  };
+
   const toggleShowAllComments = (imageId) => {
+    const image = publicImages.find(img => img.id === imageId);
+    if (!showAllComments[imageId] && image && (image.comments || []).length < image.comment_count) {
+      fetchAllComments(imageId);
+    }
     setShowAllComments(prev => ({
       ...prev,
       [imageId]: !prev[imageId]
@@ -140,6 +163,19 @@ const FeedPage = () => {
     return (image.comments || []).slice(-2); // Show last 2 comments
   };
 
+  // Resized copies let the browser pick the smallest file that fits, instead of the full original
+  const buildSrcSet = (image) => {
+    const derivatives = image.derivatives || [];
+    const preferred = derivatives.some(d => d.format === 'webp') ? 'webp' : 'jpeg';
+    const candidates = derivatives
+      .filter(d => d.format === preferred)
+      .map(d => `${d.url} ${d.width}w`);
+    if (candidates.length === 0) {
+      return undefined;
+    }
+    return [...candidates, `${image.file_path} ${image.width}w`].join(', ');
+  };
+
   if (authLoading) {
     return <div>Loading...</div>;
   }
@@ -183,6 +219,8 @@ const FeedPage = () => {
                 >
                   <img 
                     src={image.file_path} 
+                    srcSet={buildSrcSet(image)}
+                    sizes="(max-width: 768px) 100vw, 600px"
                     alt={image.alt_text || image.title || image.original_filename}
                     className="feed-image"
                   />
@@ -230,12 +268,12 @@ const FeedPage = () => {
                           </div>
                         ))}
                         
-                        {image.comments.length > 2 && (
+                        {image.comment_count > 2 && (
                           <button 
                             className="view-more-comments-btn"
                             onClick={() => toggleShowAllComments(image.id)}
                           >
-                            {showAllComments[image.id] ? 'Show less' : `View all ${image.comments.length} comments`}
+                            {showAllComments[image.id] ? 'Show less' : `View all ${image.comment_count} comments`}
                           </button>
                         )}
                       </div>